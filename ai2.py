@@ -17,95 +17,772 @@
 
 """Connect Four second generation artificial intelligence"""
 
-from multiprocessing import Pool
-from random import shuffle
-from copy import deepcopy as copy
+from os import environ
+from multiprocessing import Pool, cpu_count
+from atexit import register
+from time import time
+from random import choice, shuffle
 from board import Board
+from transposition import TranspositionTable, SharedTranspositionTable
+from transposition import EXACT, LOWER, UPPER
+from evaluation import slice_rating
+from book import open_book
+from solver import solve, open_tablebase
+import profiling
 
 
-def think(board, player, depth = 3, multiprocessing = True):
-    """main public function that figures out my best move"""
+# score of a won game, larger than any situation_rating can ever get
+VICTORY = 1 << 20
+INFINITY = 1 << 30
+
+# result of a root move whose rating ran out of time
+TIMEOUT = "timeout"
+
+# positions with no more empty cells than this are solved exactly
+SOLVER_CELLS = 14
+
+# pool of search processes, shared by all searches (see start_pool), with
+# its number of processes and the size of their tables
+pool = None
+pool_size = 0
+pool_table_size = 0
+
+# transposition table shared by the pool for Lazy SMP (see smp_search)
+shared_table = None
+
+# transposition table and move order of a worker process, both are kept for
+# the worker's lifetime, like the shared tables it has attached to (by name)
+worker_table = None
+worker_order = None
+worker_shared = {}
+
+# called with the SearchStats of every move think makes (see set_report_hook)
+report_hook = None
+
+
+def start_pool(processes = None, table_size = None):
+    """starts the pool of search processes and returns it
+
+    a running pool is reused, unless a different number of processes or
+    table size is asked for, what isn't asked for stays as it was, a new
+    pool has all cores and tables of 1 << 18 entries (one per process)
+    """
+
+    global pool, pool_size, pool_table_size
+    if processes is None: processes = pool_size or cpu_count()
+    if table_size is None: table_size = pool_table_size or 1 << 18
+    if pool is not None:
+        if (pool_size, pool_table_size) == (processes, table_size):
+            return pool
+        stop_pool()
+    pool = Pool(processes, init_worker, (table_size,))
+    pool_size = processes
+    pool_table_size = table_size
+    return pool
+
+
+def stop_pool():
+    """shuts the pool of search processes down, after all jobs are done
+
+    and frees the shared transposition table
+    """
+
+    global pool, pool_size, pool_table_size, shared_table
+    if pool is not None:
+        pool.close()
+        pool.join()
+        pool = None
+        pool_size = 0
+        pool_table_size = 0
+    if shared_table is not None:
+        shared_table.close()
+        shared_table = None
+
+register(stop_pool)
+
+
+def start_shared_table(size = 1 << 20):
+    """sets up the transposition table the pool shares and returns it
+
+    a table that has already been set up is reused, whatever its size
+    """
+
+    global shared_table
+    if shared_table is None:
+        shared_table = SharedTranspositionTable(size)
+    return shared_table
+
+
+def init_worker(table_size):
+    """prepares a freshly started search process"""
+
+    global worker_table, worker_order, report_hook
+    worker_table = TranspositionTable(table_size)
+    worker_order = MoveOrder()
+    # the process that hands out the jobs reports the moves
+    report_hook = None
+
+
+class SearchTimeout(Exception):
+    """raised inside the search when its deadline has passed"""
+
+
+class SearchStats:
+
+
+    def __init__(self):
+        """sets up the empty statistics of a search"""
+
+        self.nodes = 0               # inner nodes of the search tree
+        self.leaves = 0              # leaves rated by situation_rating
+        self.simple_solutions = 0    # moves found by simple_solution
+        self.cutoffs = 0             # beta cutoffs
+        self.cache_hits = 0          # positions found in the table
+        self.depth_times = {}        # seconds spent on every depth
+        self.column_times = {}       # seconds spent on every root move
+        self.depth = None            # last completely searched depth
+        self.choices = None          # root ratings of that depth, None for
+                                     # moves that are known to be worse
+                                     # than best (they only got a bound)
+        self.best = None             # best move of that depth
+        self.score = None            # and its rating
+        self.move = None             # the chosen move
+        self.source = None           # book, solver, simple_solution, search
+                                     # or ponder (see ai2_player)
+
+
+    def merge(self, other):
+        """adds the counters of another search (e.g. of a worker)"""
+
+        self.nodes += other.nodes
+        self.leaves += other.leaves
+        self.simple_solutions += other.simple_solutions
+        self.cutoffs += other.cutoffs
+        self.cache_hits += other.cache_hits
+        for col, seconds in other.column_times.items():
+            self.column_times[col] = self.column_times.get(col, 0) + seconds
+
+
+    def finish_depth(self, depth, seconds, choices, best = None):
+        """records a completely searched depth
+
+        without best, all choices have to be exact ratings
+        """
+
+        if best is None: best = best_choice(choices)
+        self.depth_times[depth] = seconds
+        self.depth = depth
+        self.choices = choices
+        self.best = best
+        self.score = choices[best]
+
+
+    def as_dict(self):
+        """returns the statistics as a dictionary"""
+
+        return dict(self.__dict__)
+
+
+class MoveOrder:
+
+
+    def __init__(self):
+        """sets up the move ordering without any history"""
+
+        self.centers = {}    # columns sorted by their distance to the center
+        self.killers = {}    # last two cutoff moves of every ply
+        self.history = {}    # cutoff scores of (player, col), kept over moves
+
+
+    def new_search(self):
+        """forgets the killer moves and lets the history fade"""
+
+        self.killers = {}
+        for move in self.history:
+            self.history[move] //= 2
+
+
+    def order(self, board, player, first = None):
+        """returns the columns in the order they should be searched
+
+        first (e.g. the best move of an earlier search) and the killer moves
+        of the ply come first, the rest by history and distance to center
+        """
+
+        cols = board.col_count()
+        if cols not in self.centers:
+            self.centers[cols] = sorted(range(0, cols), key = lambda col:
+                                        abs(2 * col - cols + 1))
+        history = self.history
+        columns = sorted(self.centers[cols],
+                         key = lambda col: -history.get((player, col), 0))
+        front = []
+        for col in [first] + self.killers.get(len(board.move_history), []):
+            if col is not None and col not in front: front.append(col)
+        return front + [col for col in columns if col not in front]
+
+
+    def cutoff(self, board, player, col, depth):
+        """remembers a move that caused a beta cutoff"""
+
+        ply = len(board.move_history)
+        killers = self.killers.setdefault(ply, [])
+        if col not in killers:
+            killers.insert(0, col)
+            del killers[2:]
+        self.history[(player, col)] = self.history.get((player, col), 0) + \
+                                      depth * depth
+
+
+class Search:
+
+
+    def __init__(self, table, deadline = None, stats = None, order = None,
+                 stopped = None):
+        """collects everything the nodes of a single search share
+
+        stopped is a function, that tells if the search has to be aborted
+        for some other reason than time
+        """
+
+        self.table = table
+        self.deadline = deadline
+        if stats is None: stats = SearchStats()
+        self.stats = stats
+        if order is None: order = MoveOrder()
+        self.order = order
+        self.stopped = stopped
+
+
+    def check_time(self):
+        """aborts the search if it ran out of time (or has been stopped)"""
+
+        if self.deadline is not None and time() > self.deadline:
+            raise SearchTimeout
+        if self.stopped is not None and self.stopped():
+            raise SearchTimeout
+
+
+def set_report_hook(hook):
+    """makes think call hook(stats) with the SearchStats of every move
+
+    use None to remove the hook again
+    """
+
+    global report_hook
+    report_hook = hook
+
+
+def report(stats, move, source, hook = True):
+    """completes the statistics of a move and hands them to the hook
+
+    (unless hook is False)
+    """
+
+    stats.move = move
+    stats.source = source
+    if hook and report_hook is not None: report_hook(stats)
+    return move
+
+
+def think(board, player, depth = 3, multiprocessing = True, table = None,
+          budget = None, book = True, stats = None, order = None, smp = False,
+          processes = None, stopped = None, hook = True):
+    """main public function that figures out my best move
+
+    the search makes and undoes its moves right on the board, which is back
+    in its original state once think returns
+
+    table is the TranspositionTable for single process searches, pass the
+    same table again to reuse the results of earlier searches, the same goes
+    for the MoveOrder order and its history of good moves
+
+    with multiprocessing, the pool rates every root move in a process of its
+    own, or, with smp, all processes search the whole position at once and
+    share their results through a table in shared memory (see smp_search),
+    processes sets the size of the pool (see start_pool)
+
+    if a time budget (in seconds) is given, depth is ignored: the search is
+    deepened ply by ply and the move of the last completed depth is returned
+    once the budget is used up
+
+    positions in the opening book or the tablebase of the board's geometry
+    are not searched, unless book is False, and neither are positions with
+    at most SOLVER_CELLS empty cells, which are solved exactly instead
+
+    if a SearchStats object is given, it is filled in along the way
+
+    a single process search ends early, once the function stopped returns
+    True (see Search), the move is then that of the last completed depth or
+    None, hook = False keeps the move from the report hook (e.g. for moves
+    searched in advance, see ai2_player)
+    """
 
     if not isinstance(board, Board): raise TypeError
-    enemy = player % 2 + 1
+    if table is None: table = TranspositionTable()
+    if stats is None: stats = SearchStats()
+    if order is None: order = MoveOrder()
+    table.new_search()
+    order.new_search()
+
+    # is the position in the opening book?
+    if book:
+        potential_move = book_move(board, player)
+        if potential_move is not None:
+            return report(stats, potential_move, "book", hook)
+
+    # can the position be solved exactly?
+    potential_move = perfect_move(board, player, book)
+    if potential_move is not None:
+        return report(stats, potential_move, "solver", hook)
 
     # looking for simple solutions
     potential_move = simple_solution(board, player)
-    if potential_move is not None: return potential_move
+    if potential_move is not None:
+        stats.simple_solutions += 1
+        return report(stats, potential_move, "simple_solution", hook)
+
+    # no simple solution found ... starting the search
+    if multiprocessing and smp:
+        smp_search(board, player, depth, budget, stats, processes)
+    elif multiprocessing:
+        parallel_search([board], [player], depth, budget, [stats], processes)
+    else:
+        search = Search(table, None, stats, order, stopped)
+        moves = len(board.move_history)
+
+        def search_root(searches, deadline):
+            search.deadline = deadline
+            try:
+                return [rootsearch(board, player, searches[0][1], search)]
+            except SearchTimeout:
+                # the search stopped somewhere down the tree ... back up
+                board.undo(len(board.move_history) - moves)
+                return [None]
+
+        deepen(search_root, [search_depths(board, depth, budget)],
+               search_deadline(budget), [stats])
+    return report(stats, stats.best, "search", hook)
+
+
+def think_many(boards, players, budget = None, depth = 3, book = True,
+               stats = None, processes = None):
+    """figures out the best moves for many games at once
+
+    the root moves of all boards are searched together by the pool of search
+    processes, budget, depth, book and processes work as for think, stats may
+    be a list of SearchStats objects, one for every board
+    """
+
+    if stats is None: stats = [SearchStats() for board in boards]
+    moves = []
+    for board, player, board_stats in zip(boards, players, stats):
+        if not isinstance(board, Board): raise TypeError
+        potential_move = None
+        if book:
+            potential_move = book_move(board, player)
+            if potential_move is not None:
+                report(board_stats, potential_move, "book")
+        if potential_move is None:
+            potential_move = perfect_move(board, player, book)
+            if potential_move is not None:
+                report(board_stats, potential_move, "solver")
+        if potential_move is None:
+            potential_move = simple_solution(board, player)
+            if potential_move is not None:
+                board_stats.simple_solutions += 1
+                report(board_stats, potential_move, "simple_solution")
+        moves.append(potential_move)
+
+    # no simple solution found for some boards ... searching them
+    searching = [i for i in range(len(moves)) if moves[i] is None]
+    if searching:
+        ratings = parallel_search([boards[i] for i in searching],
+                                  [players[i] for i in searching],
+                                  depth, budget, [stats[i] for i in searching],
+                                  processes)
+        for i, choices in zip(searching, ratings):
+            moves[i] = report(stats[i], best_choice(choices), "search")
+    return moves
+
+
+def book_move(board, player):
+    """returns the opening book move for player on board or None"""
+
+    opening_book = open_book(board.col_count(), board.line_count())
+    if opening_book is None: return None
+    move = opening_book.lookup(board, player)
+    if move is not None and board.move_is_valid(move): return move
+    return None
 
-    if multiprocessing:
-        # no simple solution found ... starting multiprocess recursion
-        jobs = []
-        for col in range(0, board.col_count()):
-            temp_board = copy(board)
-            if temp_board.move(col, player):
-                jobs.append((copy(temp_board), enemy, depth - 1 ))
+
+def perfect_move(board, player, tablebase = True):
+    """returns the game theoretically best move for player on board or None
+
+    the move is looked up in the tablebase of the board's geometry (unless
+    tablebase is False) or found by the solver, if few enough cells are left
+    """
+
+    if tablebase:
+        solved = open_tablebase(board.col_count(), board.line_count())
+        if solved is not None:
+            result = solved.lookup(board, player)
+            if result is not None and board.move_is_valid(result[1]):
+                return result[1]
+    if 0 < empty_cells(board) <= SOLVER_CELLS:
+        return solve(board, player)[1]
+    return None
+
+
+def best_choice(choices):
+    """returns the column with the best rating"""
+
+    move = 0
+    for i in range(1, len(choices)):
+        if choices[i] > choices[move]:
+            move = i
+    return move
+
+
+def empty_cells(board):
+    """returns the number of empty cells on board"""
+
+    return board.col_count() * board.line_count() - sum(board.heights)
+
+
+def parallel_search(boards, players, depth, budget, stats, processes = None):
+    """rates all possible moves on every board with the pool of search processes
+
+    returns a list of ratings for every board, see think for depth, budget and
+    processes, the statistics of every board go to its SearchStats in stats
+    """
+
+    workers = start_pool(processes)
+    ratings = [None] * len(boards)
+
+    def search_roots(searches, deadline):
+        # the root moves of all boards go to the pool at once
+        indices = [i for i, depth in searches]
+        results = workers.map(poolthink, rootjobs(boards, players, searches,
+                                                  deadline))
+        choices = collect_choices([boards[i] for i in indices], results,
+                                  [stats[i] for i in indices])
+        found = []
+        for i, rating in zip(indices, choices):
+            if TIMEOUT in rating:
+                found.append(None)
             else:
-                jobs.append(None)
-        workers = Pool()
-        results = workers.map(rekthink, jobs)
-        choices = []
-        for result in results:
-            if isinstance(result, Board):
-                choices.append(situation_rating(result, player))
-            else: choices.append(-32768)
-        print(choices)
-        move = 0
-        for i in range(1, board.col_count()):
-            if choices[i] > choices[move]:
-                move = i
-        return move
-    else:
-        # no simple solution found ... starting singleprocess recursion
-        choices = []
+                ratings[i] = rating
+                found.append((None, rating))
+        return found
+
+    deepen(search_roots, [search_depths(board, depth, budget)
+                          for board in boards], search_deadline(budget), stats)
+    return ratings
+
+
+def smp_search(board, player, depth, budget, stats, processes = None):
+    """rates all possible moves on board with the pool in Lazy SMP fashion
+
+    every process of the pool deepens the search of the whole position on
+    its own, while they all share one transposition table, so each of them
+    gets ahead with the results of the others, to spread them over the tree
+    the helpers start with different root moves and every second one goes a
+    ply deeper, the search ends once one of them reaches depth (or the last
+    depth that fits into the budget, see think)
+
+    returns the best move and the ratings of the deepest search (see
+    rootsearch), which also go to stats, processes is the size of the pool
+    (see start_pool)
+    """
+
+    workers = start_pool(processes)
+    table = start_shared_table()
+    table.new_search()
+    table.stop(False)
+    depth = search_depths(board, depth, budget)[-1]
+    deadline = search_deadline(budget)
+    position = board.to_bytes()
+    jobs = [(position, player, depth, deadline, table.name, table.generation,
+             helper) for helper in range(0, pool_size)]
+
+    start = time()
+    best = None
+    for helper, searched, move, choices, job_stats in \
+            workers.imap_unordered(smpthink, jobs):
+        # one search through is enough ... the others can stop
+        if searched is not None and searched >= depth: table.stop()
+        stats.merge(job_stats)
+        if searched is not None and (best is None or searched > best[1] or
+                                     searched == best[1] and helper < best[0]):
+            best = (helper, searched, move, choices)
+    table.stop(False)
+    stats.finish_depth(best[1], time() - start, best[3], best[2])
+    return best[2], best[3]
+
+
+def smpthink(job):
+    """deepens the search of a position in a pool worker (see smp_search)
+
+    returns (helper, depth, best move, ratings, stats) for the deepest depth
+    that was searched completely (all but helper and stats are None if there
+    is none)
+    """
+
+    position, player, depth, deadline, name, generation, helper = job
+    if name not in worker_shared:
+        worker_shared[name] = SharedTranspositionTable(name = name)
+    table = worker_shared[name]
+    table.generation = generation
+    worker_order.new_search()
+    board = Board.from_bytes(position)
+
+    # a fixed depth is still reached ply by ply (from depth 1, unless depth 0
+    # is all there is to search), to fill the table, then every second
+    # helper goes one ply further
+    first = 0 if deadline is not None else min(1, depth)
+    if deadline is None: depth += helper % 2
+    search = Search(table, None, order = worker_order,
+                    stopped = table.stopped)
+
+    def search_root(searches, deadline):
+        search.deadline = deadline
+        try:
+            return [rootsearch(board, player, searches[0][1], search, helper)]
+        except SearchTimeout:
+            return [None]
+
+    deepen(search_root, [range(first, depth + 1)], deadline, [search.stats])
+    return helper, search.stats.depth, search.stats.best, \
+        search.stats.choices, search.stats
+
+
+def rootjobs(boards, players, searches, deadline):
+    """returns the jobs for rating every root move of some boards
+
+    searches holds (index of the board, depth) for every board, the jobs
+    carry the boards in their compact binary encoding, which is all the
+    workers need to know about a position
+    """
+
+    jobs = []
+    for i, depth in searches:
+        position = boards[i].to_bytes()
+        for col in range(0, boards[i].col_count()):
+            jobs.append((position, col, players[i], depth, deadline))
+    return jobs
+
+
+def collect_choices(boards, results, stats):
+    """splits the results of rootjobs into one list of ratings per board
+
+    and adds the statistics of the jobs to the boards' stats
+    """
+
+    results = iter(results)
+    choices = []
+    for board, board_stats in zip(boards, stats):
+        ratings = []
         for col in range(0, board.col_count()):
-            temp_board = copy(board)
-            if temp_board.move(col, player):
-                if depth > 0:
-                    temp_board = rekthink((copy(temp_board), enemy, depth - 1))
-                choices.append(situation_rating(temp_board, player))
-            else: choices.append(-32768)
-        print(choices)
-        move = 0
-        for i in range(1, board.col_count()):
-            if choices[i] > choices[move]:
-                move = i
-        return move
-
-
-def rekthink(job):
-    """recursive thinking ...."""
-
-    # move is not possible ... nothing to do ...
-    if job is None: return None
+            result, job_stats = next(results)
+            board_stats.merge(job_stats)
+            if result is not None:
+                ratings.append(result)
+            else: ratings.append(-INFINITY)
+        choices.append(ratings)
+    return choices
+
+
+def search_depths(board, depth, budget):
+    """returns the depths a search of board goes through
+
+    that is depth alone, or with a time budget every depth from 0 until the
+    board is full (see deepen)
+    """
+
+    if budget is None: return [depth]
+    return list(range(0, max(1, empty_cells(board))))
+
+
+def search_deadline(budget):
+    """returns the time a search with budget (or None) has to end by"""
+
+    if budget is None: return None
+    return time() + budget
+
+
+def deepen(search, depths, deadline, stats):
+    """deepens the searches of one or more positions ply by ply
+
+    depths holds the depths to go through for every position and stats
+    their SearchStats, search(searches, deadline) searches some of the
+    positions at once, with searches holding (index, depth) for each of
+    them, and returns (best move or None, ratings) for every one of them or
+    None if it ran out of time (see rootsearch)
+
+    the shallowest search of every position is cheap and always has to be
+    finished, so it runs without a deadline, a position that ran out of
+    time isn't searched any deeper
+    """
+
+    active = [i for i in range(0, len(depths)) if depths[i]]
+    step = 0
+    while active:
+        start = time()
+        results = search([(i, depths[i][step]) for i in active],
+                         deadline if step > 0 else None)
+        seconds = time() - start
+        deeper = []
+        for i, result in zip(active, results):
+            if result is None:
+                stats[i].depth_times[depths[i][step]] = seconds
+                continue
+            best, choices = result
+            stats[i].finish_depth(depths[i][step], seconds, choices, best)
+            if step + 1 < len(depths[i]): deeper.append(i)
+        active = deeper
+        step += 1
+
+
+def rootsearch(board, player, depth, search, rotate = 0):
+    """rates all possible moves for the player in a single process
+
+    returns (best move, ratings), every move is searched with the rating of
+    the best one before it as alpha, so a move that fails to beat it gets
+    None instead of a rating (it is no better than best), impossible moves
+    get -INFINITY
+
+    the best move of the previous depth is rated first, rotate moves that
+    many of the first moves to the end instead (see smp_search)
+    """
+
+    columns = search.order.order(board, player, search.stats.best)
+    rotate %= len(columns)
+    choices = [-INFINITY] * board.col_count()
+    alpha = -INFINITY
+    best = None
+    for col in columns[rotate:] + columns[:rotate]:
+        result = rootthink((board, col, player, depth, search.deadline),
+                           alpha, search)
+        if result is None: continue
+        if best is None or result > alpha:
+            choices[col] = result
+            alpha = result
+            best = col
+        else:
+            choices[col] = None
+    # the board is full ... no move is possible at all
+    if best is None: best = columns[0]
+    return best, choices
+
+
+def poolthink(job):
+    """rootthink for the pool workers, returns (rating, stats)
+
+    timeouts are reported as rating instead of being raised
+    """
+
+    # in a worker process the table survives as long as the worker
+    search = Search(worker_table, job[4], order = worker_order)
+    job = (Board.from_bytes(job[0]),) + job[1:]
+    try:
+        return rootthink(job, search = search), search.stats
+    except SearchTimeout:
+        return TIMEOUT, search.stats
+
+
+def rootthink(job, alpha = -INFINITY, search = None):
+    """rates a single root move for the player who makes it"""
 
     # expand data ...
     board = job[0]
-    player = job[1]
-    depth = job[2]
+    col = job[1]
+    player = job[2]
+    depth = job[3]
     enemy = player % 2 + 1
 
-    # looking for simple solutions
+    # move is not possible ... nothing to do ...
+    if not board.move(col, player): return None
+
+    start = time()
+    try:
+        # did the root move already finish the game?
+        if board.qcheck_gameover() == player:
+            rating = VICTORY + depth + 1
+        else:
+            rating = -negamax(board, enemy, depth, -INFINITY, -alpha, search)
+    finally:
+        column_times = search.stats.column_times
+        column_times[col] = column_times.get(col, 0) + time() - start
+    board.undo()
+    return rating
+
+
+def negamax(board, player, depth, alpha, beta, search):
+    """alpha-beta search, rates the board for the player who has to move"""
+
+    # leaf of the search tree ... just rate the situation
+    if depth == 0:
+        search.stats.leaves += 1
+        return situation_rating(board, player)
+
+    search.check_time()
+    search.stats.nodes += 1
+    table = search.table
+    enemy = player % 2 + 1
+    alpha_orig = alpha
+
+    # did we see this position (or its mirror image) before?
+    key, mirrored = board.canonical_key(player)
+    entry = table.lookup(key)
+    best_move = None
+    if entry is not None:
+        search.stats.cache_hits += 1
+        if entry[1] >= depth:
+            if entry[3] == EXACT: return entry[2]
+            if entry[3] == LOWER: alpha = max(alpha, entry[2])
+            if entry[3] == UPPER: beta = min(beta, entry[2])
+            if alpha >= beta: return entry[2]
+        best_move = entry[4]
+        if mirrored: best_move = board.mirror(best_move)
+
+    # looking for simple solutions, they are the only moves worth searching
     potential_move = simple_solution(board, player)
     if potential_move is not None:
-        board.move(potential_move, player)
-        return board
+        search.stats.simple_solutions += 1
+        columns = [potential_move]
+    else:
+        # the best move of an earlier search goes first
+        columns = search.order.order(board, player, best_move)
 
-    # no simple solution found ... doing recursion ...
-    choices = []
-    for col in range(0, board.col_count()):
-        tboard = copy(board)
-        if tboard.move(col, player):
-            if depth > 0:
-                tboard = rekthink((copy(tboard), enemy, depth - 1))
-            choices.append(situation_rating(tboard, player))
-        else: choices.append(-32768)
-    move = 0
-    for i in range(1, board.col_count()):
-        if choices[i] > choices[move]:
-            move = i
-    board.move(move, player)
-    return board
+    best = -INFINITY
+    for col in columns:
+        if board.move(col, player):
+            if board.qcheck_gameover() == player:
+                # prefer quick victories over slow ones
+                rating = VICTORY + depth
+            else:
+                rating = -negamax(board, enemy, depth - 1, -beta, -alpha,
+                                  search)
+            board.undo()
+            if rating > best:
+                best = rating
+                best_move = col
+                if best > alpha: alpha = best
+                if alpha >= beta:
+                    search.stats.cutoffs += 1
+                    search.order.cutoff(board, player, col, depth)
+                    break
+
+    # no move possible ... the board is full and the game ends with a draw
+    if best == -INFINITY: return 0
+
+    if best <= alpha_orig: bound = UPPER
+    elif best >= beta: bound = LOWER
+    else: bound = EXACT
+    if mirrored: best_move = board.mirror(best_move)
+    table.store(key, depth, best, bound, best_move)
+    return best
 
 
 def simple_solution(board, player):
@@ -135,14 +812,8 @@ def simple_solution(board, player):
 def instant_victory(board, player):
     """checks if it is possible for player to win instantly"""
 
-    columns = list(range(0, board.col_count()))
-    shuffle(columns)
-    for col in columns:
-        if board.move(col, player):
-            result = board.qcheck_gameover()
-            board.undo()
-            if result == player:
-                return col
+    columns = board.columns(board.winning_moves(player))
+    if columns: return choice(columns)
     return None
 
 
@@ -150,84 +821,36 @@ def double_bind_construction(board, player):
     """checks if player can construct a double bind"""
 
     enemy = player % 2 + 1
+    stride = board.stride
+    playable = board.playable()
     columns = list(range(0, board.col_count()))
     shuffle(columns)
     for col in columns:
-        if board.move(col, player):
+        bit = playable & (((1 << stride) - 1) << col * stride)
+        if bit:
             # made the move to col ... checking the situation
 
             # did I help my enemy?
-            if board.move(col, enemy):
-                result = board.qcheck_gameover()
-                board.undo()
-                if result == enemy: board.undo(); break
-
-            # counting the my enemy's binds
-            binds = 0
-            for col2 in columns:
-                if board.move(col2, player):
-                    result = board.qcheck_gameover()
-                    board.undo()
-                    if result == player:
-                        binds += 1
-                        if binds >= 2: board.undo(); return col
-
-            # no db found with col ... tidying up
-            board.undo()
+            if (bit << 1) & board.inside & board.threats[enemy]: break
+
+            # counting the my enemy's binds: the cells where I would win,
+            # that can be played after my move
+            binds = board.winning_cells(board.masks[player] | bit) & \
+                    ((playable ^ bit) | ((bit << 1) & board.inside))
+            if binds & (binds - 1): return col
     return None
 
 
 def situation_rating(board, player):
-    """calculates a rating for the players situation"""
-
-    rating = 0
-    enemy = player % 2 + 1
-
-    for i in range(0, board.line_count()):
-        rating += slice_rating(board.line(i), player)
-        rating -= slice_rating(board.line(i), enemy)
+    """calculates a rating for the players situation
 
-    for i in range(0, board.col_count()):
-        rating += slice_rating(board.col(i), player)
-        rating -= slice_rating(board.col(i), enemy)
+    the board keeps the rating up to date while moves are made and undone
+    """
 
-    for i in range(3, board.line_count() + board.col_count() - 4):
-        rating += slice_rating(board.diagonal1(i), player)
-        rating -= slice_rating(board.diagonal1(i), enemy)
-        rating += slice_rating(board.diagonal2(i), player)
-        rating -= slice_rating(board.diagonal2(i), enemy)
-
-    return rating
+    if player == 1: return board.situation_rating()
+    else: return -board.situation_rating()
 
 
-def slice_rating(slc, player):
-    """calculates the rating for a single slice of the board"""
-
-    rating = 0
-    p = str(player)
-
-    # single token
-    rating +=  1 * slc.count(p+"000")
-    rating +=  2 * slc.count("0"+p+"00")
-    rating +=  2 * slc.count("00"+p+"0")
-    rating +=  1 * slc.count("000"+p)
-    # double token
-    rating +=  8 * slc.count(2*p+"00")
-    rating +=  8 * slc.count(p+"0"+p+"0")
-    rating +=  8 * slc.count(p+"00"+p)
-    rating +=  8 * slc.count("0"+2*p+"0")
-    rating +=  8 * slc.count("0"+p+"0"+p)
-    rating +=  8 * slc.count("00"+2*p)
-    rating += 16 * slc.count("0"+2*p+"00")
-    rating += 16 * slc.count("00"+2*p+"0")
-    rating += 16 * slc.count("0"+p+"0"+p+"0")
-    # triple token
-    rating += 128 * slc.count(3*p+"0")
-    rating += 128 * slc.count(2*p+"0"+p)
-    rating += 128 * slc.count(p+"0"+2*p)
-    rating += 128 * slc.count("0"+3*p)
-    rating += 512 * slc.count("0"+3*p+"0")
-    # quad token = victory :)
-    rating += 32768 * slc.count(4*p)
-
-    return rating
+# opt-in profiling of the primitives (see profiling)
+if environ.get(profiling.ENVIRONMENT):
+    profiling.enable(environ[profiling.ENVIRONMENT])
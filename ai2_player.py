@@ -17,21 +17,156 @@
 
 """OOP interface for AI2 module"""
 
-from copy import deepcopy as copy
-from ai2 import think as inner_think
+from threading import Thread, Condition
+from ai2 import think as inner_think, MoveOrder, SearchStats, report
+from board import Board
+from transposition import TranspositionTable
 
 
 class ArtificialIntelligence:
 
 
-    def __init__(self, player):
+    def __init__(self, player, table_size = 1 << 18):
         """set me up as new AI player"""
 
         self.me = player
         self.enemy = self.me % 2 + 1
 
+        # remember positions and good moves from earlier moves
+        # throughout the game, that's why I search in this process (the
+        # processes of a pool would each keep tables of their own)
+        self.table = TranspositionTable(table_size)
+        self.order = MoveOrder()
 
-    def think(self, board, depth = 4):
-        """generates a move for the player"""
+        # background thread, that searches my answers to the enemy's
+        # possible moves, while the enemy is thinking (see ponder), it is
+        # started once and waits for the next turn in between, the
+        # condition guards everything it shares with think
+        self.ponder_thread = None
+        self.condition = Condition()
+        self.pondering = []     # positions that are still to be searched
+        self.running = None     # position that is searched right now
+        self.pondered = {}      # (move, stats) of every searched position
+        self.stopping = False   # tells the running search to stop
+        self.closed = False     # tells the thread to end
 
-        return inner_think(copy(board), self.me, depth)
+
+    def think(self, board, depth = 4, budget = None, stats = None):
+        """generates a move for the player
+
+        with a time budget (in seconds) the search depth is chosen to fit it,
+        a SearchStats object passed as stats is filled in by the search
+
+        if the position has been pondered on, the answer found in the
+        background is used
+        """
+
+        pondered = self.pondered_move(board, depth, budget)
+        if pondered is not None:
+            move, pondered_stats = pondered
+            if stats is None: stats = SearchStats()
+            stats.__dict__.update(pondered_stats.__dict__)
+            return report(stats, move, "ponder")
+        return inner_think(board, self.me, depth, multiprocessing = False,
+                           table = self.table, budget = budget, stats = stats,
+                           order = self.order)
+
+
+    def ponder(self, board, depth = 4, budget = None):
+        """starts searching my answers to the enemy's moves in the background
+
+        this returns right away, the enemy's moves are searched one after the
+        other, the most likely ones first, with the same depth and budget as
+        the think call they should answer and with my table and move order,
+        so whatever the background search finds helps think as well
+        """
+
+        self.stop_pondering()
+        jobs = []
+        for col in self.order.order(board, self.enemy):
+            if board.move(col, self.enemy):
+                if board.check_gameover() == 0:
+                    jobs.append((board.to_bytes(), depth, budget))
+                board.undo()
+        with self.condition:
+            if self.ponder_thread is None:
+                self.closed = False
+                self.ponder_thread = Thread(target = self.ponder_loop)
+                self.ponder_thread.daemon = True
+                self.ponder_thread.start()
+            self.pondering = jobs
+            self.condition.notify_all()
+
+
+    def ponder_loop(self):
+        """searches the positions ponder hands out, until close is called
+
+        runs in the background thread
+        """
+
+        while True:
+            with self.condition:
+                while not self.pondering and not self.closed:
+                    self.condition.wait()
+                if self.closed: return
+                job = self.running = self.pondering.pop(0)
+            stats = SearchStats()
+            move = inner_think(Board.from_bytes(job[0]), self.me, job[1],
+                               multiprocessing = False, table = self.table,
+                               budget = job[2], stats = stats,
+                               order = self.order,
+                               stopped = self.stop_requested, hook = False)
+            with self.condition:
+                # a stopped search didn't get as far as it was meant to
+                if not self.stopping: self.pondered[job] = (move, stats)
+                self.running = None
+                self.condition.notify_all()
+
+
+    def stop_requested(self):
+        """tells the background search if it has to stop"""
+
+        return self.stopping
+
+
+    def pondered_move(self, board, depth, budget):
+        """returns (move, stats) pondered for the position or None
+
+        a running background search of the position is waited for, as it is
+        ahead of a new search, all other background searches are stopped
+        """
+
+        job = (board.to_bytes(), depth, budget)
+        with self.condition:
+            while self.running == job:
+                self.condition.wait()
+            result = self.pondered.get(job)
+        self.stop_pondering()
+        return result
+
+
+    def stop_pondering(self):
+        """stops the background searches and waits until they are stopped
+
+        the background thread stays around for the next ponder
+        """
+
+        with self.condition:
+            self.pondering = []
+            self.pondered = {}
+            self.stopping = True
+            while self.running is not None:
+                self.condition.wait()
+            self.stopping = False
+
+
+    def close(self):
+        """stops the background searches and ends the background thread"""
+
+        self.stop_pondering()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.ponder_thread is not None:
+            self.ponder_thread.join()
+            self.ponder_thread = None
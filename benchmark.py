@@ -0,0 +1,265 @@
+# Copyright (c) 2013, Robert Rueger <rueger@itp.uni-frankfurt.de>
+#
+# This file is part of RC4.
+#
+# RC4 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# RC4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RC4.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Reproducible benchmarks for the Connect Four engine
+
+Searches a fixed corpus of positions on every board geometry from 4x4 to
+10x10 and times the Board primitives, e.g.
+
+    python benchmark.py --depths 1 2 3 --output bench.json
+
+The results are written as JSON, so that runs can be compared over time. All
+positions of the corpus are searched, none of them is answered by the solver
+or simple_solution, so the summary tells how fast the search is.
+"""
+
+import json
+import random
+import platform
+from time import time
+from timeit import Timer, default_timer
+from board import Board
+import ai2
+
+
+# share of the board that is filled in each game phase of the corpus
+PHASES = (("opening", 0.1), ("middlegame", 0.35), ("endgame", 0.6))
+
+# random games played for every position of the corpus at most, before a
+# phase is given up with fewer positions
+TRIES = 200
+
+
+def corpus(seed = 2013, geometries = None, count = 5):
+    """returns the benchmark positions as a list of (name, board, player)
+
+    the positions are played randomly from an empty board, but always the
+    same ones for the same seed, there are count positions of every phase
+    on every geometry, all of them searched by think (see searched), phases
+    that leave too few empty cells for a search are left out
+    """
+
+    if geometries is None:
+        geometries = [(cols, lines) for cols in range(4, 11)
+                      for lines in range(4, 11)]
+    rng = random.Random(seed)
+    positions = []
+    for cols, lines in geometries:
+        for phase, filled in PHASES:
+            filled = int(filled * cols * lines)
+            if cols * lines - filled <= ai2.SOLVER_CELLS: continue
+            found = 0
+            for tries in range(0, TRIES * count):
+                board, player = quiet_game(cols, lines, filled, rng)
+                if board is None or not searched(board, player, seed):
+                    continue
+                found += 1
+                name = "%dx%d %s %d" % (cols, lines, phase, found)
+                positions.append((name, board, player))
+                if found == count: break
+    return positions
+
+
+def quiet_game(cols, lines, filled, rng):
+    """plays filled random moves, that neither win nor let the other player
+    win right away, and returns (board, player to move) or (None, None) if
+    there is no such move at some point
+    """
+
+    board = Board(cols, lines)
+    player = 1
+    while len(board.move_history) < filled:
+        enemy = player % 2 + 1
+        quiet = []
+        for col in range(0, cols):
+            if board.move(col, player):
+                if board.check_gameover() == 0 and \
+                   not board.winning_moves(enemy):
+                    quiet.append(col)
+                board.undo()
+        if not quiet: return None, None
+        board.move(rng.choice(quiet), player)
+        player = enemy
+    return board, player
+
+
+def searched(board, player, seed = 2013):
+    """tells if think searches the position (with the random numbers the
+    search benchmark uses), instead of taking a move from the solver or
+    simple_solution, which would say nothing about the speed of the search
+    """
+
+    if ai2.empty_cells(board) <= ai2.SOLVER_CELLS: return False
+    random.seed(seed)
+    return ai2.simple_solution(board, player) is None
+
+
+def percentile(values, p):
+    """returns the p-th percentile (nearest rank) of values"""
+
+    values = sorted(values)
+    rank = max(0, int(round(p / 100.0 * len(values) + 0.5)) - 1)
+    return values[min(rank, len(values) - 1)]
+
+
+def search_benchmark(positions, depths, seed = 2013):
+    """searches every position with every depth in a single process"""
+
+    results = []
+    for depth in depths:
+        for name, board, player in positions:
+            random.seed(seed)
+            stats = ai2.SearchStats()
+            start = time()
+            move = ai2.think(board, player, depth, multiprocessing = False,
+                             book = False, stats = stats)
+            seconds = time() - start
+            results.append({"position": name, "depth": depth, "move": move,
+                            "source": stats.source, "seconds": seconds,
+                            "nodes": stats.nodes + stats.leaves,
+                            "cutoffs": stats.cutoffs,
+                            "cache_hits": stats.cache_hits})
+    return results
+
+
+def summary(results):
+    """sums the search results up per depth and per source of the move
+
+    only the moves with source "search" went through the search, the others
+    came from the solver or simple_solution and say nothing about its speed
+    """
+
+    groups = {}
+    for result in results:
+        groups.setdefault((result["depth"], result["source"]),
+                          []).append(result)
+    summaries = {}
+    for (depth, source), results in groups.items():
+        seconds = [result["seconds"] for result in results]
+        nodes = sum(result["nodes"] for result in results)
+        summaries.setdefault(str(depth), {})[source] = {
+            "positions": len(results),
+            "nodes": nodes,
+            "seconds": sum(seconds),
+            "nodes_per_second": nodes / max(sum(seconds), 1e-9),
+            "latency": {"p50": percentile(seconds, 50),
+                        "p90": percentile(seconds, 90),
+                        "p99": percentile(seconds, 99),
+                        "max": max(seconds)}}
+    return summaries
+
+
+def board_benchmark(positions, number = 10000):
+    """times the Board primitives on the given positions, in seconds per call"""
+
+    results = {}
+    for name, board, player in positions:
+        col = [col for col in range(board.cols) if board.move_is_valid(col)][0]
+
+        def move_rate_undo():
+            board.move(col, player)
+            ai2.situation_rating(board, player)
+            board.undo()
+
+        timings = {}
+        timings["move"], timings["undo"] = move_undo_times(board, player,
+                                                           number)
+        for primitive, function in (
+                ("move_rate_undo", move_rate_undo),
+                ("qcheck_gameover", board.qcheck_gameover),
+                ("check_gameover", board.check_gameover),
+                ("simple_solution",
+                 lambda: ai2.simple_solution(board, player)),
+                ("situation_rating",
+                 lambda: ai2.situation_rating(board, player))):
+            timings[primitive] = min(Timer(function).repeat(3, number)) / number
+        results[name] = timings
+    return results
+
+
+def move_undo_times(board, player, number = 10000):
+    """times Board.move and Board.undo on board, in seconds per call
+
+    the empty cells are filled up column by column and emptied again, until
+    about number moves have been made, the moves and the undos are timed
+    apart from each other (the best of three runs, like Timer.repeat)
+    """
+
+    enemy = player % 2 + 1
+    moves = [(col, (player, enemy)[i % 2]) for i, col in enumerate(
+             [col for col in range(board.cols)
+              for line in range(board.heights[col], board.lines)])]
+    rounds = max(1, number // len(moves))
+    move_times, undo_times = [], []
+    for repeat in range(0, 3):
+        move_time = undo_time = 0.0
+        for i in range(0, rounds):
+            start = default_timer()
+            for col, mover in moves: board.move(col, mover)
+            middle = default_timer()
+            for move in moves: board.undo()
+            move_time += middle - start
+            undo_time += default_timer() - middle
+        move_times.append(move_time)
+        undo_times.append(undo_time)
+    calls = rounds * len(moves)
+    return min(move_times) / calls, min(undo_times) / calls
+
+
+def run(depths = (1, 2, 3), seed = 2013, geometries = None, count = 5):
+    """runs all benchmarks and returns the results
+
+    with count positions of every phase on every geometry (see corpus), the
+    Board primitives are timed on the first middlegame of every geometry
+    """
+
+    positions = corpus(seed, geometries, count)
+    results = search_benchmark(positions, depths, seed)
+    middlegames = [position for position in positions
+                   if position[0].endswith(" middlegame 1")]
+    return {"meta": {"seed": seed,
+                     "depths": list(depths),
+                     "positions": count,
+                     "time": time(),
+                     "python": platform.python_version(),
+                     "platform": platform.platform()},
+            "summary": summary(results),
+            "search": results,
+            "board": board_benchmark(middlegames)}
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description = "benchmarks the Connect Four engine")
+    parser.add_argument("--depths", type = int, nargs = "+",
+                        default = [1, 2, 3], help = "search depths")
+    parser.add_argument("--seed", type = int, default = 2013,
+                        help = "seed of the corpus and the search")
+    parser.add_argument("--positions", type = int, default = 5,
+                        help = "positions of every phase on every geometry")
+    parser.add_argument("--geometry", nargs = 2, type = int, action = "append",
+                        metavar = ("COLS", "LINES"), dest = "geometries",
+                        help = "only benchmark this board size (repeatable)")
+    parser.add_argument("--output", default = None,
+                        help = "file for the JSON results (default: stdout)")
+    args = parser.parse_args()
+    results = run(args.depths, args.seed, args.geometries, args.positions)
+    if args.output is None:
+        print(json.dumps(results, indent = 2, sort_keys = True))
+    else:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent = 2, sort_keys = True)
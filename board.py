@@ -18,6 +18,37 @@
 """Class for a connect-4 board"""
 
 from os import name as os_name
+from random import Random
+from struct import Struct
+from evaluation import evaluator
+
+
+# random keys for zobrist hashing, generated once per board geometry
+_zobrist_keys = {}
+
+# binary encoding of a position: cols, lines and both player masks,
+# each split into two 64 bit words (see Board.to_bytes)
+ENCODING = Struct("<BBQQQQ")
+WORD = (1 << 64) - 1
+
+
+def zobrist_keys(cols, lines):
+    """returns the hash keys for a cols x lines board
+
+    the keys are drawn from a generator with a fixed seed, so that every
+    process (and every run) hashes the same position to the same value
+    """
+
+    try:
+        return _zobrist_keys[(cols, lines)]
+    except KeyError:
+        rng = Random(cols * 256 + lines)
+        cells = cols * (lines + 1)
+        keys = ([0, rng.getrandbits(64), rng.getrandbits(64)],
+                [rng.getrandbits(64) for i in range(cells)],
+                [rng.getrandbits(64) for i in range(cells)])
+        _zobrist_keys[(cols, lines)] = keys
+        return keys
 
 
 class Board:
@@ -29,16 +60,66 @@ class Board:
         # initialize move history
         self.move_history = []
 
-        # build a new board
-        # can be accessed like this: board[line][col]
-        # board[0][0] is in the upper left corner
+        # build a new bitboard
+        # every column gets lines + 1 bits, bit (col * (lines + 1) + row)
+        # is the cell in column col and row row (counted from the bottom)
+        # the extra bit on top of each column always stays empty, so that
+        # shifting a mask never makes a row wrap into the next column
         self.cols = cols
         self.lines = lines
-        self.board = []
-        for i in range(lines):
-            self.board.append([])
-            for j in range(cols):
-                self.board[i].append(0)
+        self.stride = lines + 1
+        self.masks = [0, 0, 0]  # one mask per player, masks[0] is unused
+        self.heights = [0] * cols
+
+        # bottom has the lowest cell of every column set, inside all cells
+        # that are on the board (no extra bits)
+        self.bottom = sum(1 << col * self.stride for col in range(cols))
+        self.inside = self.bottom * ((1 << lines) - 1)
+
+        # threat map: threats[player] has every cell set, where a token of
+        # player would complete four in a row (no matter if the cell is
+        # free or reachable), the maps of earlier positions are stacked
+        self.threats = [0, 0, 0]
+        self.threat_history = []
+
+        # status of the game: the number of tokens on the board, the winner
+        # (or 0) and the number of tokens there were after the winning move
+        self.filled = 0
+        self.winner = 0
+        self.win_filled = 0
+
+        # zobrist hash of the position, updated with every move and undo
+        # zobrist[player][bit] is the key of player's token on a cell,
+        # zobrist[0][player] marks whose turn it is (see key())
+        # mirror_hash is the hash of the position reflected left to right
+        self.zobrist = zobrist_keys(cols, lines)
+        self.hash = 0
+        self.mirror_hash = 0
+
+        # running situation rating of player 1 (see situation_rating)
+        # codes holds the current code of every slice the evaluator rates,
+        # both include the first rated moves of the move history
+        self.evaluator = evaluator(cols, lines)
+        self.codes = [0] * len(self.evaluator.slices)
+        self.rating = 0
+        self.rated = 0
+
+
+    def __getstate__(self):
+        """leaves the shared hash keys out of copies and pickles"""
+
+        state = self.__dict__.copy()
+        del state["zobrist"]
+        del state["evaluator"]
+        return state
+
+
+    def __setstate__(self, state):
+        """restores a copied or unpickled board"""
+
+        self.__dict__.update(state)
+        self.zobrist = zobrist_keys(self.cols, self.lines)
+        self.evaluator = evaluator(self.cols, self.lines)
 
 
     def __str__(self):
@@ -70,12 +151,13 @@ class Board:
         for i in range(0,self.lines):
             for j in range(0,self.cols):
                 output.append(" ")
-                if self.board[i][j] == 0:
-                    output.append(gray + str(self.board[i][j]))
-                elif self.board[i][j] == 1:
-                    output.append(green + str(self.board[i][j]))
-                elif self.board[i][j] == 2:
-                    output.append(red + str(self.board[i][j]))
+                element = self.cell(i, j)
+                if element == 0:
+                    output.append(gray + str(element))
+                elif element == 1:
+                    output.append(green + str(element))
+                elif element == 2:
+                    output.append(red + str(element))
             output.append("\n")
 
         # tidy up and return output string
@@ -87,18 +169,82 @@ class Board:
     def dump(self):
         """returns the board as a 2dim list"""
 
-        return self.board
+        return [[self.cell(i, j) for j in range(self.cols)]
+                for i in range(self.lines)]
+
+
+    def to_bytes(self):
+        """returns the position as a fixed size string of bytes
+
+        only the tokens are encoded, the move history is left out
+        """
+
+        return ENCODING.pack(self.cols, self.lines,
+                             self.masks[1] & WORD, self.masks[1] >> 64,
+                             self.masks[2] & WORD, self.masks[2] >> 64)
+
+
+    @classmethod
+    def from_bytes(cls, data):
+        """returns a new board with the position encoded by to_bytes"""
+
+        cols, lines, low1, high1, low2, high2 = ENCODING.unpack(data)
+        board = cls(cols, lines)
+        masks = (0, low1 | high1 << 64, low2 | high2 << 64)
+        if masks[1] & masks[2]:
+            raise ValueError("position has overlapping tokens!")
+        for col in range(cols):
+            for row in range(lines + 1):
+                bit = col * board.stride + row
+                for player in (1, 2):
+                    if masks[player] >> bit & 1:
+                        if row != board.heights[col] or row == lines:
+                            raise ValueError("position has floating tokens!")
+                        board.masks[player] |= 1 << bit
+                        board.hash ^= board.zobrist[player][bit]
+                        board.mirror_hash ^= board.zobrist[player][
+                            (cols - 1 - col) * board.stride + row]
+                        board.heights[col] += 1
+                        board.filled += 1
+                        board.update_rating(bit, player)
+        if board.masks[1] != masks[1] or board.masks[2] != masks[2]:
+            raise ValueError("position doesn't fit on the board!")
+        board.threats = [0, board.winning_cells(masks[1]),
+                         board.winning_cells(masks[2])]
+        for player in (2, 1):
+            if board.four_in_a_row(masks[player]): board.winner = player
+        board.win_filled = board.filled if board.winner else 0
+        return board
+
+
+    def cell(self, line, col):
+        """returns the player (or 0) at position [line][col]"""
+
+        bit = 1 << (col * self.stride + self.lines - 1 - line)
+        if self.masks[1] & bit: return 1
+        if self.masks[2] & bit: return 2
+        return 0
 
 
     def move(self, move, player):
         """updates the board, when a player makes a valid move"""
 
         if self.move_is_valid(move):
-            # look for the first free slot in column (bottom-up)
-            i = self.lines - 1
-            while i > 0 and self.board[i][move] != 0:
-                i -= 1
-            self.board[i][move] = player
+            # the first free slot in the column is right above its height
+            bit = move * self.stride + self.heights[move]
+            self.masks[player] |= 1 << bit
+            self.hash ^= self.zobrist[player][bit]
+            self.mirror_hash ^= self.zobrist[player][
+                (self.cols - 1 - move) * self.stride + self.heights[move]]
+            self.heights[move] += 1
+            self.filled += 1
+            # a move into one of the player's threats wins the game
+            if not self.winner and self.threats[player] >> bit & 1:
+                self.winner = player
+                self.win_filled = self.filled
+            # a move only adds threats of the player who made it
+            self.threat_history.append(self.threats[player])
+            self.threats[player] = self.winning_cells(self.masks[player])
             # update the history
             self.move_history.append((player, move))
             return True
@@ -106,15 +252,40 @@ class Board:
             return False
 
 
+    def situation_rating(self):
+        """returns the situation rating of player 1
+
+        moves only enter the rating once it is asked for, so that all the
+        moves that are made and undone in between never cost anything
+        """
+
+        if self.rated < len(self.move_history):
+            heights = {}
+            for player, col in self.move_history[self.rated:][::-1]:
+                heights[col] = heights.get(col, self.heights[col]) - 1
+                self.update_rating(col * self.stride + heights[col], player)
+            self.rated = len(self.move_history)
+        return self.rating
+
+
+    def update_rating(self, bit, value):
+        """adds value to a cell and updates the rating of its slices"""
+
+        codes = self.codes
+        rating = self.rating
+        for i, power, table in self.evaluator.cells[bit]:
+            code = codes[i] + value * power
+            rating += table[code] - table[codes[i]]
+            codes[i] = code
+        self.rating = rating
+
+
     def move_is_valid(self, move):
         """checks if a move is possible on a board"""
 
         try:
-            if self.board[0][move] == 0:
-                return True
-            else:
-                return False
-        except IndexError:
+            return 0 <= move < self.cols and self.heights[move] < self.lines
+        except TypeError:
             return False
 
 
@@ -126,14 +297,53 @@ class Board:
             j += 1
 
             move = self.move_history.pop()
-            i = 0
-            while self.board[i][move[1]] == 0: i += 1
-            if self.board[i][move[1]] == move[0]:
-                self.board[i][move[1]] = 0
+            self.heights[move[1]] -= 1
+            self.filled -= 1
+            if self.filled < self.win_filled:
+                self.winner = 0
+                self.win_filled = 0
+            bit = move[1] * self.stride + self.heights[move[1]]
+            if self.masks[move[0]] & (1 << bit):
+                self.masks[move[0]] ^= 1 << bit
+                self.hash ^= self.zobrist[move[0]][bit]
+                self.mirror_hash ^= self.zobrist[move[0]][
+                    (self.cols - 1 - move[1]) * self.stride +
+                    self.heights[move[1]]]
+                self.threats[move[0]] = self.threat_history.pop()
+                if len(self.move_history) < self.rated:
+                    self.update_rating(bit, -move[0])
+                    self.rated -= 1
             else:
                 raise ValueError("board history is corrupted!")
 
 
+    def key(self, player):
+        """returns the hash of the position with player to move"""
+
+        return self.hash ^ self.zobrist[0][player]
+
+
+    def canonical_key(self, player):
+        """returns (key, mirrored) of the position with player to move
+
+        a position and its mirror image share the smaller of their two keys,
+        mirrored tells if that is the key of the mirror image, so that moves
+        have to be mirrored (see mirror) before they are stored or used
+        """
+
+        key = self.hash ^ self.zobrist[0][player]
+        mirror_key = self.mirror_hash ^ self.zobrist[0][player]
+        if mirror_key < key: return mirror_key, True
+        return key, False
+
+
+    def mirror(self, col):
+        """returns the column col is reflected to (None stays None)"""
+
+        if col is None: return None
+        return self.cols - 1 - col
+
+
     def dimensions(self):
         """returns the boards dimensions (lines, cols)"""
 
@@ -155,15 +365,17 @@ class Board:
     def element(self, line, col):
         """returns the element at position [line][col] as string"""
 
-        try: return str(self.board[line][col])
-        except: return ""
+        if 0 <= line < self.lines and 0 <= col < self.cols:
+            return str(self.cell(line, col))
+        else:
+            return ""
 
 
     def line(self, n):
         """returns line n as a string"""
 
         if 0 <= n < self.lines:
-            return "".join(str(element) for element in self.board[n])
+            return "".join(str(self.cell(n, j)) for j in range(self.cols))
         else:
             return ""
 
@@ -174,7 +386,7 @@ class Board:
         if 0 <= n < self.cols:
             result = []
             for i in range(0, self.lines):
-                result.append(str(self.board[i][n]))
+                result.append(str(self.cell(i, n)))
             return "".join(result)
         else:
             return ""
@@ -191,7 +403,7 @@ class Board:
         else:
             return ""
         while line >= 0 and col < self.cols:
-            result.append(str(self.board[line][col]))
+            result.append(str(self.cell(line, col)))
             line -= 1
             col += 1
         return "".join(result)
@@ -208,7 +420,7 @@ class Board:
         else:
             return []
         while line >= 0 and col < self.cols and col >= 0:
-            result.append(str(self.board[line][col]))
+            result.append(str(self.cell(line, col)))
             line -= 1
             col -= 1
         return "".join(result)
@@ -225,32 +437,62 @@ class Board:
         return result
 
 
+    def four_in_a_row(self, mask):
+        """checks if a bitmask contains four connected tokens"""
+
+        # vertical, horizontal and both diagonal directions
+        for shift in (1, self.stride, self.stride + 1, self.stride - 1):
+            pairs = mask & (mask >> shift)
+            if pairs & (pairs >> 2 * shift): return True
+        return False
+
+
+    def winning_cells(self, mask):
+        """returns the cells that would complete four in a row for mask"""
+
+        # vertically only the three tokens right below a cell count
+        cells = (mask << 1) & (mask << 2) & (mask << 3)
+        # in every other direction the cell can be anywhere in the four
+        for shift in (self.stride, self.stride + 1, self.stride - 1):
+            pairs = (mask << shift) & (mask << 2 * shift)
+            cells |= pairs & (mask << 3 * shift)
+            cells |= pairs & (mask >> shift)
+            pairs = (mask >> shift) & (mask >> 2 * shift)
+            cells |= pairs & (mask << shift)
+            cells |= pairs & (mask >> 3 * shift)
+        return cells & self.inside
+
+
+    def playable(self):
+        """returns the mask of the cells, that can be played next"""
+
+        return ((self.masks[1] | self.masks[2]) + self.bottom) & self.inside
+
+
+    def winning_moves(self, player):
+        """returns the mask of the cells, where player can win right now"""
+
+        return self.threats[player] & self.playable()
+
+
+    def columns(self, cells):
+        """returns the list of columns, that have a cell in the mask cells"""
+
+        column = (1 << self.stride) - 1
+        return [col for col in range(0, self.cols)
+                if cells >> col * self.stride & column]
+
+
     def check_gameover(self):
         """checks if the game is over
 
         and returns either 0 if not finished, 3 if game draw or the winner(1/2)
         """
 
+        if self.winner: return self.winner
+
         # board is completely full? (draw)
-        if 0 not in self.board[0]: return 3
-
-        # horizontal
-        for i in range(0, self.lines):
-            line = self.line(i)
-            if line.count("1111") > 0: return 1
-            if line.count("2222") > 0: return 2
-
-        # vertical
-        for i in range(0, self.cols):
-            col = self.col(i)
-            if col.count("1111") > 0: return 1
-            if col.count("2222") > 0: return 2
-
-        # diagonal
-        for i in range(3, self.lines + self.cols - 4):
-            diag = self.diagonal1(i) + " " + self.diagonal2(i)
-            if diag.count("1111") > 0: return 1
-            if diag.count("2222") > 0: return 2
+        if self.filled == self.cols * self.lines: return 3
 
         # nothing found? game is not over then ...
         return 0
@@ -259,9 +501,6 @@ class Board:
     def qcheck_gameover(self):
         """quickly checks if the last move has finished the game"""
 
-        move = self.move_history[-1]
-        line = 0
-        while self.board[line][move[1]] == 0: line += 1
-        for direction in self.vincinity(line, move[1]):
-            if direction.count(4*str(move[0])) > 0: return move[0]
+        player = self.move_history[-1][0]
+        if self.winner == player: return player
         return 0
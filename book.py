@@ -0,0 +1,214 @@
+# Copyright (c) 2013, Robert Rueger <rueger@itp.uni-frankfurt.de>
+#
+# This file is part of RC4.
+#
+# RC4 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# RC4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RC4.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Opening book for the Connect Four AI
+
+The book maps positions (hashed with Board.canonical_key, so that a position
+and its mirror image share one record) to their best move. It is generated
+offline with the ai2 search, e.g. for all positions of the first 6 plies on a
+7x6 board:
+
+    python book.py 7 6 --plies 6 --depth 5
+
+and is looked up through a memory-mapped file, so opening a book costs next to
+nothing and a lookup is a binary search over the sorted records.
+"""
+
+import os
+import struct
+from mmap import mmap, ACCESS_READ
+from board import Board
+
+
+# default location of the books
+BOOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "books")
+
+# file header: magic, cols, lines, plies, number of records
+HEADER = struct.Struct("<4sBBBxI")
+
+# books that have been opened, by geometry (None if there is no book)
+_books = {}
+
+
+class RecordFile:
+
+
+    def __init__(self, path, magic, record):
+        """opens a file of sorted records written by write_records
+
+        record is the struct format of a record, starting with the key
+        """
+
+        self.record = struct.Struct(record)
+        self.file = open(path, "rb")
+        self.data = mmap(self.file.fileno(), 0, access = ACCESS_READ)
+        file_magic, self.cols, self.lines, self.plies, self.count = \
+            HEADER.unpack_from(self.data, 0)
+        if file_magic != magic or \
+           len(self.data) != HEADER.size + self.count * self.record.size:
+            self.close()
+            raise ValueError(path + " is not a valid record file!")
+
+
+    def __len__(self):
+        """returns the number of records"""
+
+        return self.count
+
+
+    def find(self, key):
+        """returns the values of the record with key or None"""
+
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record = self.record.unpack_from(self.data, HEADER.size +
+                                             middle * self.record.size)
+            if record[0] < key: low = middle + 1
+            elif record[0] > key: high = middle
+            else: return record[1:]
+        return None
+
+
+    def close(self):
+        """releases the file"""
+
+        self.data.close()
+        self.file.close()
+
+
+def write_records(path, magic, record, cols, lines, plies, records):
+    """writes (key, values ...) records to a file that RecordFile can read"""
+
+    record = struct.Struct(record)
+    records = sorted(records)
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory): os.makedirs(directory)
+    # write to a temporary file first, so that readers never see half a file
+    with open(path + ".tmp", "wb") as output:
+        output.write(HEADER.pack(magic, cols, lines, plies, len(records)))
+        for values in records:
+            output.write(record.pack(*values))
+    os.rename(path + ".tmp", path)
+
+
+class OpeningBook(RecordFile):
+
+
+    def __init__(self, path):
+        """opens the book in the file path"""
+
+        RecordFile.__init__(self, path, b"RC4B", "<QB")
+
+
+    def lookup(self, board, player):
+        """returns the book move for player on board or None"""
+
+        if board.dimensions() != (self.lines, self.cols): return None
+        key, mirrored = board.canonical_key(player)
+        values = self.find(key)
+        if values is None: return None
+        if mirrored: return board.mirror(values[0])
+        return values[0]
+
+
+def book_path(cols, lines, directory = BOOK_DIR):
+    """returns the file name of the book for a cols x lines board"""
+
+    return os.path.join(directory, "book_%dx%d.bin" % (cols, lines))
+
+
+def open_book(cols, lines):
+    """returns the OpeningBook for a cols x lines board or None
+
+    every book is opened only once and shared afterwards
+    """
+
+    if (cols, lines) not in _books:
+        path = book_path(cols, lines)
+        if os.path.exists(path): _books[(cols, lines)] = OpeningBook(path)
+        else: _books[(cols, lines)] = None
+    return _books[(cols, lines)]
+
+
+def book_positions(cols, lines, plies):
+    """returns all positions of the first plies of a game as (board, player)
+
+    player 1 makes the first move, finished games are left out and of a
+    position and its mirror image only one is returned
+    """
+
+    positions = {}
+    board = Board(cols, lines)
+
+    def expand(player, ply):
+        positions.setdefault(board.canonical_key(player)[0],
+                             (list(board.move_history), player))
+        if ply == plies: return
+        for col in range(0, cols):
+            if board.move(col, player):
+                if board.qcheck_gameover() == 0 and \
+                   board.canonical_key(player % 2 + 1)[0] not in positions:
+                    expand(player % 2 + 1, ply + 1)
+                board.undo()
+
+    expand(1, 0)
+    result = []
+    for history, player in positions.values():
+        position = Board(cols, lines)
+        for move in history: position.move(move[1], move[0])
+        result.append((position, player))
+    return result
+
+
+def generate(cols, lines, plies, depth = 5, path = None, chunk = 256):
+    """searches the best move for all positions of the first plies of a game
+    and writes them to a book
+    """
+
+    from ai2 import think_many
+
+    if path is None: path = book_path(cols, lines)
+    positions = book_positions(cols, lines, plies)
+    records = []
+    for i in range(0, len(positions), chunk):
+        boards = [board for board, player in positions[i:i + chunk]]
+        players = [player for board, player in positions[i:i + chunk]]
+        moves = think_many(boards, players, depth = depth, book = False)
+        for board, player, move in zip(boards, players, moves):
+            key, mirrored = board.canonical_key(player)
+            records.append((key, board.mirror(move) if mirrored else move))
+    write_records(path, b"RC4B", "<QB", cols, lines, plies, records)
+    return len(records)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description = "generates an opening book")
+    parser.add_argument("cols", type = int)
+    parser.add_argument("lines", type = int)
+    parser.add_argument("--plies", type = int, default = 4,
+                        help = "book covers the first plies of a game")
+    parser.add_argument("--depth", type = int, default = 5,
+                        help = "search depth for the book moves")
+    parser.add_argument("--output", default = None,
+                        help = "file name of the book")
+    args = parser.parse_args()
+    count = generate(args.cols, args.lines, args.plies, args.depth,
+                     args.output)
+    print(str(count) + " positions written to " +
+          (args.output or book_path(args.cols, args.lines)))
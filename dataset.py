@@ -0,0 +1,232 @@
+# Copyright (c) 2013, Robert Rueger <rueger@itp.uni-frankfurt.de>
+#
+# This file is part of RC4.
+#
+# RC4 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# RC4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RC4.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Self-play dataset of labelled positions for tuning the evaluation
+
+Plays ai2 against itself on a pool of processes and appends every searched
+position to a binary file, e.g. 1000 games on a 7x6 board with depth 3:
+
+    python dataset.py positions.bin --games 1000 --geometry 7 6 --depth 3
+
+Every record holds the position (in the encoding of Board.to_bytes), the
+player to move, the rating of the search and the final result of the game,
+both for the player to move. Records are appended as soon as a game is over,
+a generation that has been interrupted picks up where it stopped when it is
+started again with the same file. The file is read through a memory map:
+
+    for game, position, player, score, result, remaining in Dataset(path):
+        board = Board.from_bytes(position)
+"""
+
+import os
+import random
+from struct import Struct
+from mmap import mmap, ACCESS_READ
+from multiprocessing import Pool
+from board import Board
+import ai2
+
+
+# file header: magic, cols, lines
+HEADER = Struct("<4sBBxx")
+MAGIC = b"RC4S"
+
+# record: game number, position, player to move, score, result and the number
+# of records of the game that follow (0 for the last one)
+RECORD = Struct("<I34sBibH")
+
+# score of a position, whose move was found without a search (by the solver
+# or as a simple solution)
+NO_SCORE = -(1 << 31)
+
+
+class Dataset:
+
+
+    def __init__(self, path):
+        """opens the dataset in the file path"""
+
+        self.file = open(path, "rb")
+        self.data = mmap(self.file.fileno(), 0, access = ACCESS_READ)
+        magic, self.cols, self.lines = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(path + " is not a dataset!")
+        # a record that is still being written doesn't count
+        self.count = (len(self.data) - HEADER.size) // RECORD.size
+
+
+    def __len__(self):
+        """returns the number of records"""
+
+        return self.count
+
+
+    def __getitem__(self, index):
+        """returns the record (game, position, player, score, result,
+        remaining) with the given index
+        """
+
+        if index < 0: index += self.count
+        if not 0 <= index < self.count: raise IndexError(index)
+        return RECORD.unpack_from(self.data, HEADER.size + index * RECORD.size)
+
+
+    def __iter__(self):
+        """iterates over all records"""
+
+        for index in range(0, self.count):
+            yield self[index]
+
+
+    def close(self):
+        """releases the file"""
+
+        self.data.close()
+        self.file.close()
+
+
+def play_game(job):
+    """plays a game of ai2 against itself, returns (game number, records)
+    with the records packed one after the other
+
+    the job is (game number, cols, lines, depth, budget, random plies, seed),
+    the first random plies are random moves, which aren't recorded
+    """
+
+    game, cols, lines, depth, budget, random_plies, seed = job
+    random.seed(seed + game)  # the search picks among equal moves at random
+    rng = random.Random(seed + game)
+    board = Board(cols, lines)
+    player = 1
+    positions = []
+    while board.check_gameover() == 0:
+        if len(board.move_history) < random_plies:
+            move = rng.choice([col for col in range(0, cols)
+                               if board.move_is_valid(col)])
+        else:
+            stats = ai2.SearchStats()
+            position = board.to_bytes()
+            move = ai2.think(board, player, depth, multiprocessing = False,
+                             table = ai2.worker_table, budget = budget,
+                             book = False, stats = stats,
+                             order = ai2.worker_order)
+            if stats.score is not None: score = stats.score
+            else: score = NO_SCORE
+            positions.append((position, player, score))
+        board.move(move, player)
+        player = player % 2 + 1
+
+    winner = board.check_gameover()
+    records = []
+    for i, (position, player, score) in enumerate(positions):
+        if winner == player: result = 1
+        elif winner == 3: result = 0
+        else: result = -1
+        records.append(RECORD.pack(game, position, player, score, result,
+                                   len(positions) - 1 - i))
+    return game, b"".join(records)
+
+
+def self_play(jobs, processes = None, table_size = 1 << 18):
+    """plays the games of jobs (see play_game) on a pool of processes
+
+    and yields (game number, packed records) for every game, as soon as it
+    is over, the games finish in no particular order
+    """
+
+    workers = Pool(processes, ai2.init_worker, (table_size,))
+    try:
+        for game, data in workers.imap_unordered(play_game, jobs):
+            yield game, data
+    finally:
+        workers.terminate()
+        workers.join()
+
+
+def finished_games(path, cols, lines):
+    """returns the numbers of the games, that are complete in the dataset
+
+    the dataset is cut back to its last complete game, a missing dataset
+    is created
+    """
+
+    if not os.path.exists(path):
+        with open(path, "wb") as output:
+            output.write(HEADER.pack(MAGIC, cols, lines))
+        return set()
+
+    dataset = Dataset(path)
+    try:
+        if (dataset.cols, dataset.lines) != (cols, lines):
+            raise ValueError(path + " holds games of another board size!")
+        games = set()
+        end = 0
+        for index, record in enumerate(dataset):
+            if record[5] == 0:
+                games.add(record[0])
+                end = index + 1
+    finally:
+        dataset.close()
+    with open(path, "r+b") as output:
+        output.truncate(HEADER.size + end * RECORD.size)
+    return games
+
+
+def generate(path, games, cols = 7, lines = 6, depth = 3, budget = None,
+             random_plies = 4, processes = None, seed = 2013):
+    """plays games and appends their positions to the dataset in path
+
+    games that are already in the dataset (of an earlier, interrupted
+    generation with the same settings) are skipped, returns the number of
+    games that have been played
+    """
+
+    done = finished_games(path, cols, lines)
+    jobs = [(game, cols, lines, depth, budget, random_plies, seed)
+            for game in range(0, games) if game not in done]
+    with open(path, "ab") as output:
+        for game, data in self_play(jobs, processes):
+            # a game is written in one piece, so that an interruption can
+            # only ever cut off the last one
+            output.write(data)
+            output.flush()
+    return len(jobs)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description = "generates a self-play dataset")
+    parser.add_argument("path", help = "file of the dataset")
+    parser.add_argument("--games", type = int, default = 100,
+                        help = "number of games (including earlier ones)")
+    parser.add_argument("--geometry", nargs = 2, type = int, default = (7, 6),
+                        metavar = ("COLS", "LINES"), help = "board size")
+    parser.add_argument("--depth", type = int, default = 3,
+                        help = "search depth")
+    parser.add_argument("--budget", type = float, default = None,
+                        help = "time budget per move (instead of a depth)")
+    parser.add_argument("--random-plies", type = int, default = 4,
+                        help = "number of random moves that start a game")
+    parser.add_argument("--processes", type = int, default = None,
+                        help = "number of processes (default: all cores)")
+    parser.add_argument("--seed", type = int, default = 2013)
+    args = parser.parse_args()
+    played = generate(args.path, args.games, args.geometry[0],
+                      args.geometry[1], args.depth, args.budget,
+                      args.random_plies, args.processes, args.seed)
+    print(str(played) + " games added to " + args.path)
@@ -24,8 +24,11 @@ from board import Board
 from ai2_player import ArtificialIntelligence
 
 
-def Main(p1_is_ai, p2_is_ai, cols, lines):
-    """main function, that manages the game"""
+def Main(p1_is_ai, p2_is_ai, cols, lines, ai_budget = None):
+    """main function, that manages the game
+
+    ai_budget limits the AI's thinking time per move (in seconds)
+    """
 
     # getting everything ready ...
     board = Board(cols, lines)
@@ -45,6 +48,11 @@ def Main(p1_is_ai, p2_is_ai, cols, lines):
         print(board)
         print(str(turn) + "th turn: It's player " \
               + str(active_player) + "'s turn!")
+        # the AI thinks about its answers while the human is thinking
+        if active_player == 1 and not p1_is_ai and p2_is_ai:
+            ai2.ponder(board, budget = ai_budget)
+        if active_player == 2 and not p2_is_ai and p1_is_ai:
+            ai1.ponder(board, budget = ai_budget)
         while True:  # get a valid move from the player
             try:
                 if (active_player == 1 and not p1_is_ai) or \
@@ -52,6 +60,8 @@ def Main(p1_is_ai, p2_is_ai, cols, lines):
                     # human player is active
                     move = input("Enter column: ")
                     if move == "b":
+                        if p1_is_ai: ai1.close()
+                        if p2_is_ai: ai2.close()
                         return
                     else:
                         move = int(move)
@@ -60,9 +70,9 @@ def Main(p1_is_ai, p2_is_ai, cols, lines):
                     print("AI is thinking ...")
                     ai_starttime = time()
                     if active_player == 1:
-                        move = ai1.think(board)
+                        move = ai1.think(board, budget = ai_budget)
                     if active_player == 2:
-                        move = ai2.think(board)
+                        move = ai2.think(board, budget = ai_budget)
                     ai_duration = time() - ai_starttime
                     ai_msg = "AI makes its move: col " + str(move) + " after " + \
                              str(round(ai_duration, 3)) + "s"
@@ -74,6 +84,10 @@ def Main(p1_is_ai, p2_is_ai, cols, lines):
                 print("Not a valid move! Enter b to cancel the game ...")
         board.move(move, active_player)
 
+    # end of the game, nothing left to ponder on
+    if p1_is_ai: ai1.close()
+    if p2_is_ai: ai2.close()
+
     # end of the game, print the board and the results
     ClearScreen()
     print(board)
@@ -0,0 +1,258 @@
+# Copyright (c) 2013, Robert Rueger <rueger@itp.uni-frankfurt.de>
+#
+# This file is part of RC4.
+#
+# RC4 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# RC4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RC4.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Opt-in profiling of the Board and ai2 primitives
+
+Profiling is off by default and then costs nothing at all. It is switched on
+with an environment variable (checked when ai2 is imported)
+
+    RC4_PROFILE=rc4.prof python start.py
+
+or from code with profiling.enable("rc4.prof"). The primitives listed in
+PRIMITIVES are then replaced by wrappers, that count their calls and add up
+their time (in total and without the time of the other primitives they call).
+Every process, pool workers included, writes its numbers to rc4.prof.<pid>
+when it ends, and the main process merges them into rc4.prof, which is in the
+format of the profile module:
+
+    python -m pstats rc4.prof
+"""
+
+import os
+import sys
+import marshal
+from glob import glob
+from atexit import register
+from timeit import default_timer as timer
+from multiprocessing import current_process
+from multiprocessing.util import Finalize
+
+
+# environment variable with the file name of the profile
+ENVIRONMENT = "RC4_PROFILE"
+
+# profiled functions, by module and class (or None for module functions)
+PRIMITIVES = [
+    ("board", "Board", ["move", "undo", "situation_rating", "update_rating",
+                        "check_gameover", "qcheck_gameover", "winning_cells",
+                        "playable", "canonical_key", "vincinity", "to_bytes",
+                        "from_bytes"]),
+    ("ai2", None, ["think", "rootthink", "negamax", "simple_solution",
+                   "instant_victory", "double_bind_construction",
+                   "situation_rating", "book_move", "perfect_move"]),
+    ("solver", None, ["solve", "negamax"]),
+]
+
+
+class Profile:
+
+
+    def __init__(self):
+        """sets up the empty profile of the current process"""
+
+        self.pid = os.getpid()
+        # stats[function] = [primitive calls, calls, time, cumulative time,
+        # callers], callers[function] holds the same numbers per caller
+        self.stats = {}
+        self.stack = []      # [function, time in profiled calls] per call
+        self.active = {}     # number of running calls of every function
+                             # and of every (caller, function)
+
+
+    def record(self, function, caller, elapsed, internal, outermost):
+        """adds a finished call of function
+
+        outermost tells if it is the outermost running call of the function
+        and if it is the outermost running call from this caller
+        """
+
+        entry = self.stats.get(function)
+        if entry is None:
+            entry = self.stats[function] = [0, 0, 0.0, 0.0, {}]
+        numbers = [(entry, outermost[0])]
+        if caller is not None:
+            if caller not in entry[4]: entry[4][caller] = [0, 0, 0.0, 0.0]
+            numbers.append((entry[4][caller], outermost[1]))
+        for item, outer in numbers:
+            item[1] += 1
+            item[2] += internal
+            # recursive calls are part of the outermost call's time
+            if outer:
+                item[0] += 1
+                item[3] += elapsed
+
+
+    def marshal(self):
+        """returns the profile in the format of the profile module
+
+        which starts with the primitive calls for a function, but with all
+        calls for its callers
+        """
+
+        return dict((function, (entry[0], entry[1], entry[2], entry[3],
+                                dict((caller, (numbers[1], numbers[0],
+                                               numbers[2], numbers[3]))
+                                     for caller, numbers in
+                                     entry[4].items())))
+                    for function, entry in self.stats.items())
+
+
+# the profile of this process, None while profiling is off
+profile = None
+
+# file name of the profile and the replaced functions (owner, name, original)
+profile_path = None
+originals = []
+
+
+def wrap(function, original):
+    """returns a profiling wrapper for original, which is known as function"""
+
+    def wrapper(*args, **kwargs):
+        current = profile
+        if current.pid != os.getpid(): current = restart()
+        stack = current.stack
+        caller = stack[-1][0] if stack else None
+        frame = [function, 0.0]
+        stack.append(frame)
+        active = current.active
+        depth = active.get(function, 0)
+        active[function] = depth + 1
+        edge = (caller, function)
+        edge_depth = active.get(edge, 0)
+        active[edge] = edge_depth + 1
+        start = timer()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            elapsed = timer() - start
+            stack.pop()
+            active[function] = depth
+            active[edge] = edge_depth
+            if stack: stack[-1][1] += elapsed
+            current.record(function, caller, elapsed, elapsed - frame[1],
+                           (depth == 0, edge_depth == 0))
+
+    wrapper.__name__ = original.__name__
+    wrapper.__doc__ = original.__doc__
+    return wrapper
+
+
+def enable(path = "rc4.prof"):
+    """starts profiling the primitives into the file path
+
+    processes started from now on profile as well, be it by forking or by
+    importing ai2 afresh
+    """
+
+    global profile, profile_path
+    if profile is not None: return
+    profile = Profile()
+    profile_path = path
+    os.environ[ENVIRONMENT] = path
+    functions = {}       # wrapper of every module function
+    for module_name, class_name, names in PRIMITIVES:
+        owner = __import__(module_name)
+        if class_name is not None: owner = getattr(owner, class_name)
+        for name in names:
+            attribute = owner.__dict__[name]
+            if isinstance(attribute, classmethod):
+                original = attribute.__func__
+            else:
+                original = attribute
+            code = original.__code__
+            function = (code.co_filename, code.co_firstlineno, code.co_name)
+            wrapper = wrap(function, original)
+            if isinstance(attribute, classmethod):
+                wrapper = classmethod(wrapper)
+            originals.append((owner, name, attribute))
+            setattr(owner, name, wrapper)
+            if class_name is None: functions[original] = wrapper
+    # names bound with from ... import (like solve in ai2) are copies, which
+    # have to be replaced in every module that holds them
+    for module in list(sys.modules.values()):
+        namespace = getattr(module, "__dict__", None)
+        if not isinstance(namespace, dict): continue
+        for name, attribute in list(namespace.items()):
+            try:
+                wrapper = functions.get(attribute)
+            except TypeError:  # not hashable
+                continue
+            if wrapper is not None:
+                originals.append((module, name, attribute))
+                setattr(module, name, wrapper)
+    if current_process().name == "MainProcess":
+        register(finish)
+    else:
+        Finalize(None, dump, exitpriority = 10)
+
+
+def disable():
+    """stops profiling and puts the original functions back
+
+    the numbers collected so far are kept, see dump
+    """
+
+    while originals:
+        owner, name, attribute = originals.pop()
+        setattr(owner, name, attribute)
+    if os.environ.get(ENVIRONMENT) == profile_path:
+        del os.environ[ENVIRONMENT]
+
+
+def restart():
+    """starts an empty profile in a freshly forked process"""
+
+    global profile
+    profile = Profile()
+    Finalize(None, dump, exitpriority = 10)
+    return profile
+
+
+def dump(path = None):
+    """writes the profile of this process to path (by default the file name
+    of the profile, followed by the process id)
+    """
+
+    if profile is None or profile.pid != os.getpid(): return
+    if path is None: path = profile_path + "." + str(profile.pid)
+    with open(path, "wb") as output:
+        marshal.dump(profile.marshal(), output)
+
+
+def merge(path):
+    """merges the profiles of all processes into the file path"""
+
+    import pstats
+
+    parts = [part for part in glob(path + ".*")
+             if part[len(path) + 1:].isdigit()]
+    if not parts: return
+    stats = pstats.Stats(parts[0])
+    for part in parts[1:]: stats.add(part)
+    stats.dump_stats(path)
+    for part in parts: os.remove(part)
+
+
+def finish():
+    """lets the pool write its profiles and merges them with this process'"""
+
+    import ai2
+
+    ai2.stop_pool()
+    dump()
+    merge(profile_path)
@@ -0,0 +1,249 @@
+# Copyright (c) 2013, Robert Rueger <rueger@itp.uni-frankfurt.de>
+#
+# This file is part of RC4.
+#
+# RC4 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# RC4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RC4.  If not, see <http://www.gnu.org/licenses/>.
+
+"""asyncio game server that hosts many Connect Four games at once
+
+Clients talk to the server over a local socket, one JSON object per line:
+
+    {"op": "new", "cols": 7, "lines": 6, "ai": [2], "depth": 4}
+    {"op": "move", "game": 1, "col": 3}
+    {"op": "state", "game": 1}
+    {"op": "close", "game": 1}
+
+and get one JSON object per request back, with "ok" telling whether the
+request succeeded (and "error" why not) and the state of the game. An "id"
+given with a request is sent back with its reply, since replies of slow
+requests may overtake each other. Whenever an AI player has to move, the
+search runs on a pool of processes, so the server keeps serving all other
+games in the meantime. The server needs Python 3.7 or newer:
+
+    python3 server.py --port 4444
+"""
+
+import json
+import asyncio
+from itertools import count
+from concurrent.futures import ProcessPoolExecutor
+from board import Board
+from evaluation import evaluator
+import ai2
+
+
+# the board sizes the server offers (columns and lines alike)
+SIZES = range(4, 11)
+
+
+def ai_move(position, player, depth, budget):
+    """searches the AI's move in a worker process
+
+    the position comes in the binary encoding of Board.to_bytes
+    """
+
+    return ai2.think(Board.from_bytes(position), player, depth,
+                     multiprocessing = False, table = ai2.worker_table,
+                     budget = budget, order = ai2.worker_order)
+
+
+class Session:
+
+
+    def __init__(self, number, cols, lines, ai, depth, budget):
+        """sets up a new game"""
+
+        self.number = number
+        self.board = Board(cols, lines)
+        self.ai = ai
+        self.depth = depth
+        self.budget = budget
+        # requests of the same game are handled one after the other
+        self.lock = asyncio.Lock()
+
+
+    def player(self):
+        """returns the player who has to move (player 1 starts)"""
+
+        return len(self.board.move_history) % 2 + 1
+
+
+    def state(self):
+        """returns the state of the game as a dictionary"""
+
+        return {"game": self.number,
+                "cols": self.board.col_count(),
+                "lines": self.board.line_count(),
+                "board": self.board.dump(),
+                "moves": [move for player, move in self.board.move_history],
+                "status": self.board.check_gameover(),
+                "turn": self.player()}
+
+
+class Server:
+
+
+    def __init__(self, processes = None, table_size = 1 << 18):
+        """sets up a server without any games"""
+
+        self.sessions = {}
+        self.numbers = count(1)
+        # the rating tables of all board sizes are built right away, so that
+        # building them never holds up the other games
+        for cols in SIZES:
+            for lines in SIZES: evaluator(cols, lines)
+        self.executor = ProcessPoolExecutor(processes, initializer =
+                                            ai2.init_worker,
+                                            initargs = (table_size,))
+
+
+    async def serve(self, host = "127.0.0.1", port = 4444, path = None):
+        """accepts clients until cancelled"""
+
+        if path is None:
+            server = await asyncio.start_server(self.client, host, port)
+        else:
+            server = await asyncio.start_unix_server(self.client, path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown()
+
+
+    async def client(self, reader, writer):
+        """handles the requests of a client, each one as a separate task"""
+
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                task = asyncio.ensure_future(self.reply(line, writer,
+                                                        write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks: await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+
+    async def reply(self, line, writer, write_lock):
+        """answers a single request"""
+
+        request = {}
+        try:
+            request = json.loads(line)
+            response = await self.handle(request)
+            response["ok"] = True
+        except (ValueError, KeyError, TypeError) as error:
+            response = {"ok": False, "error": str(error)}
+        except Exception as error:
+            # the client gets an answer, whatever went wrong
+            response = {"ok": False, "error": "internal error: " + repr(error)}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        async with write_lock:
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+
+
+    async def handle(self, request):
+        """carries out a request and returns the response"""
+
+        op = request["op"]
+        if op == "new":
+            cols = int(request.get("cols", 7))
+            lines = int(request.get("lines", 6))
+            if cols not in SIZES or lines not in SIZES:
+                raise ValueError("board size must be between %d and %d!" %
+                                 (SIZES[0], SIZES[-1]))
+            ai = [int(player) for player in request.get("ai", [])]
+            if not set(ai) <= set([1, 2]):
+                raise ValueError("AI players must be 1 or 2!")
+            depth = int(request.get("depth", 4))
+            if depth < 0: raise ValueError("depth must not be negative!")
+            budget = request.get("budget")
+            if budget is not None:
+                budget = float(budget)
+                if not budget > 0: raise ValueError("budget must be positive!")
+            session = Session(next(self.numbers), cols, lines, ai, depth,
+                              budget)
+            self.sessions[session.number] = session
+            async with session.lock:
+                try:
+                    await self.ai_turns(session)
+                except Exception:
+                    # a game that can't get going is no game at all
+                    del self.sessions[session.number]
+                    raise
+                return session.state()
+
+        session = self.sessions.get(request.get("game"))
+        if session is None: raise KeyError("no such game!")
+        if op == "state":
+            return session.state()
+        if op == "close":
+            del self.sessions[session.number]
+            return {"game": session.number}
+        if op == "move":
+            async with session.lock:
+                if session.board.check_gameover() != 0:
+                    raise ValueError("the game is over!")
+                if session.player() in session.ai:
+                    raise ValueError("it's the AI's turn!")
+                moves = len(session.board.move_history)
+                if not session.board.move(int(request["col"]),
+                                          session.player()):
+                    raise ValueError("not a valid move!")
+                try:
+                    await self.ai_turns(session)
+                except Exception:
+                    # take the move back, so that the human can try again
+                    session.board.undo(len(session.board.move_history) -
+                                       moves)
+                    raise
+                return session.state()
+        raise ValueError("unknown op " + str(op) + "!")
+
+
+    async def ai_turns(self, session):
+        """lets the AI players move until it's a human's turn again"""
+
+        loop = asyncio.get_event_loop()
+        while session.board.check_gameover() == 0 and \
+              session.player() in session.ai:
+            player = session.player()
+            move = await loop.run_in_executor(self.executor, ai_move,
+                                              session.board.to_bytes(), player,
+                                              session.depth, session.budget)
+            session.board.move(move, player)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description = "hosts Connect Four games")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 4444)
+    parser.add_argument("--unix", default = None,
+                        help = "listen on this unix socket instead")
+    parser.add_argument("--processes", type = int, default = None,
+                        help = "processes for the AI (default: all cores)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(Server(args.processes).serve(args.host, args.port,
+                                                 args.unix))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,204 @@
+# Copyright (c) 2013, Robert Rueger <rueger@itp.uni-frankfurt.de>
+#
+# This file is part of RC4.
+#
+# RC4 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# RC4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RC4.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Exact solver and tablebase for small Connect Four boards
+
+solve finds the game theoretic value of a position by an exhaustive alpha-beta
+search. Solved positions can be stored in a tablebase, e.g. all positions of
+a 5x4 board:
+
+    python solver.py 5 4
+
+which is looked up through a memory-mapped file just like the opening book.
+"""
+
+import os
+from board import Board
+from book import RecordFile, write_records, BOOK_DIR
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+
+# tablebases that have been opened, by geometry (None if there is none)
+_tablebases = {}
+
+
+def solve(board, player, table = None):
+    """returns (value, move) for the player who has to move on board
+
+    the value is the number of plies until the game is won (positive), lost
+    (negative) or 0 for a draw, assuming perfect play on both sides, the
+    move is the best one (None if the game is over)
+    """
+
+    if table is None: table = TranspositionTable()
+    empty = board.col_count() * board.line_count() - sum(board.heights)
+    order = center_first(board.col_count())
+    score, move = negamax(board, player, -empty, empty, empty, table, order)
+    if move is None:
+        # the search didn't need to look at the moves ... they're all equal
+        for col in order:
+            if board.move_is_valid(col): move = col; break
+    if score > 0: return empty - score + 1, move
+    if score < 0: return -(empty + score + 1), move
+    return 0, move
+
+
+def center_first(cols):
+    """returns the columns sorted by their distance to the center"""
+
+    return sorted(range(0, cols), key = lambda col: abs(2 * col - cols + 1))
+
+
+def negamax(board, player, alpha, beta, empty, table, order):
+    """exhaustive alpha-beta search, returns (score, move)
+
+    a game won by the player to move with empty cells left before the
+    winning move scores empty, a lost game the negative and a draw 0
+    """
+
+    enemy = player % 2 + 1
+
+    # can I win right away?
+    winning = board.columns(board.winning_moves(player))
+    for col in order:
+        if col in winning: return empty, col
+
+    # the board is full ... draw
+    if empty == 0: return 0, None
+
+    # the earliest possible victory is with my next but one move
+    # and the earliest possible defeat with the enemy's next move
+    beta = min(beta, empty - 2)
+    alpha = max(alpha, -(empty - 1))
+    if alpha >= beta: return alpha, None
+
+    # did we see this position before?
+    alpha_orig = alpha
+    key, mirrored = board.canonical_key(player)
+    entry = table.lookup(key)
+    columns = order
+    if entry is not None:
+        move = board.mirror(entry[4]) if mirrored else entry[4]
+        if entry[3] == EXACT: return entry[2], move
+        if entry[3] == LOWER: alpha = max(alpha, entry[2])
+        if entry[3] == UPPER: beta = min(beta, entry[2])
+        if alpha >= beta: return entry[2], move
+        if move is not None:
+            columns = [move] + [col for col in order if col != move]
+
+    best, best_move = -empty, None
+    for col in columns:
+        if board.move(col, player):
+            score = -negamax(board, enemy, -beta, -alpha, empty - 1, table,
+                             order)[0]
+            board.undo()
+            if best_move is None or score > best:
+                best, best_move = score, col
+                if best > alpha: alpha = best
+                if alpha >= beta: break
+
+    if best <= alpha_orig: bound = UPPER
+    elif best >= beta: bound = LOWER
+    else: bound = EXACT
+    table.store(key, empty, best, bound,
+                board.mirror(best_move) if mirrored else best_move)
+    return best, best_move
+
+
+class Tablebase(RecordFile):
+
+
+    def __init__(self, path):
+        """opens the tablebase in the file path"""
+
+        RecordFile.__init__(self, path, b"RC4T", "<QbB")
+
+
+    def lookup(self, board, player):
+        """returns (value, move) for player on board (see solve) or None"""
+
+        if board.dimensions() != (self.lines, self.cols): return None
+        key, mirrored = board.canonical_key(player)
+        values = self.find(key)
+        if values is None or not mirrored: return values
+        return values[0], board.mirror(values[1])
+
+
+def tablebase_path(cols, lines, directory = BOOK_DIR):
+    """returns the file name of the tablebase for a cols x lines board"""
+
+    return os.path.join(directory, "tablebase_%dx%d.bin" % (cols, lines))
+
+
+def open_tablebase(cols, lines):
+    """returns the Tablebase for a cols x lines board or None
+
+    every tablebase is opened only once and shared afterwards
+    """
+
+    if (cols, lines) not in _tablebases:
+        path = tablebase_path(cols, lines)
+        if os.path.exists(path): _tablebases[(cols, lines)] = Tablebase(path)
+        else: _tablebases[(cols, lines)] = None
+    return _tablebases[(cols, lines)]
+
+
+def generate(cols, lines, plies = None, path = None, table_size = 1 << 20):
+    """solves all positions of the first plies of a game (all positions by
+    default) and writes them to a tablebase
+
+    player 1 makes the first move, finished games are left out
+    """
+
+    if path is None: path = tablebase_path(cols, lines)
+    if plies is None: plies = cols * lines
+    board = Board(cols, lines)
+    table = TranspositionTable(table_size)
+    records = {}
+
+    def expand(player, ply):
+        value, move = solve(board, player, table)
+        key, mirrored = board.canonical_key(player)
+        records[key] = (value, board.mirror(move) if mirrored else move)
+        if ply == plies: return
+        for col in range(0, cols):
+            if board.move(col, player):
+                if board.check_gameover() == 0 and \
+                   board.canonical_key(player % 2 + 1)[0] not in records:
+                    expand(player % 2 + 1, ply + 1)
+                board.undo()
+
+    expand(1, 0)
+    write_records(path, b"RC4T", "<QbB", cols, lines, plies,
+                  [(key, value, move)
+                   for key, (value, move) in records.items()])
+    return len(records)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description = "generates a tablebase")
+    parser.add_argument("cols", type = int)
+    parser.add_argument("lines", type = int)
+    parser.add_argument("--plies", type = int, default = None,
+                        help = "tablebase covers the first plies of a game")
+    parser.add_argument("--output", default = None,
+                        help = "file name of the tablebase")
+    args = parser.parse_args()
+    count = generate(args.cols, args.lines, args.plies, args.output)
+    print(str(count) + " positions written to " +
+          (args.output or tablebase_path(args.cols, args.lines)))
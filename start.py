@@ -70,7 +70,22 @@ while exit != True:
                 break
             except ValueError:
                 print("Number of rows must be between 4 and 10!")
-        Main(player1_is_ai, player2_is_ai, cols, lines)  # start the game!
+        ai_budget = None
+        if player1_is_ai or player2_is_ai:
+            while True:
+                try:
+                    ai_budget = input("Seconds per AI move (empty for none): ")
+                    if ai_budget == "":
+                        ai_budget = None
+                    else:
+                        ai_budget = float(ai_budget)
+                        if ai_budget <= 0:
+                            raise ValueError
+                    break
+                except ValueError:
+                    print("Time per move must be a positive number!")
+        Main(player1_is_ai, player2_is_ai, cols, lines,
+             ai_budget)  # start the game!
 
     else:  # user wants to quit
         exit = True
@@ -0,0 +1,214 @@
+# Copyright (c) 2013, Robert Rueger <rueger@itp.uni-frankfurt.de>
+#
+# This file is part of RC4.
+#
+# RC4 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# RC4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RC4.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Headless tournament between Connect Four engines
+
+Plays AI vs AI games on a pool of processes, without any terminal output, and
+writes the win/draw/loss tables and the time every move took as JSON, e.g.
+
+    python tournament.py --engine ai2:depth=2 --engine ai2:budget=0.5 \\
+        --engine random --geometry 7 6 --games 100 --output results.json
+
+Engines are given as kind:option=value,... where kind is ai2 (options depth,
+budget and book) or random. Every pair of engines plays the given number of
+games on every geometry, each engine making the first move in half of them.
+"""
+
+import json
+import random
+from time import time
+from multiprocessing import Pool
+from board import Board
+from transposition import TranspositionTable
+from benchmark import percentile
+import ai2
+
+
+def parse_engine(spec):
+    """returns the engine described by spec as a dictionary"""
+
+    kind, _, options = spec.partition(":")
+    if kind not in ("ai2", "random"):
+        raise ValueError("unknown engine " + kind + "!")
+    engine = {"name": spec, "kind": kind, "depth": 3, "budget": None,
+              "book": True}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        if key == "depth": engine["depth"] = int(value)
+        elif key == "budget": engine["budget"] = float(value)
+        elif key == "book": engine["book"] = value.lower() in ("1", "yes", "true")
+        else: raise ValueError("unknown engine option " + key + "!")
+    return engine
+
+
+def engine_move(engine, board, player, memory, rng):
+    """lets engine figure out its move for player on board
+
+    memory is the engine's (TranspositionTable, MoveOrder) of the game
+    """
+
+    if engine["kind"] == "random":
+        return rng.choice([col for col in range(0, board.col_count())
+                           if board.move_is_valid(col)])
+    return ai2.think(board, player, engine["depth"], multiprocessing = False,
+                     table = memory[0], budget = engine["budget"],
+                     book = engine["book"], order = memory[1])
+
+
+def play_game(job):
+    """plays a single game and returns its record
+
+    the job is (game number, engine of player 1, engine of player 2, cols,
+    lines, seed), the search runs in this process only
+    """
+
+    number, engine1, engine2, cols, lines, seed = job
+    random.seed(seed)  # the search picks among equal moves at random
+    rng = random.Random(seed)
+    engines = {1: engine1, 2: engine2}
+    memory = {1: (TranspositionTable(), ai2.MoveOrder()),
+              2: (TranspositionTable(), ai2.MoveOrder())}
+    board = Board(cols, lines)
+    player = 1
+    timings = {1: [], 2: []}
+    while board.check_gameover() == 0:
+        start = time()
+        move = engine_move(engines[player], board, player, memory[player], rng)
+        timings[player].append(time() - start)
+        if not board.move(move, player):
+            raise ValueError(engines[player]["name"] + " made an invalid move!")
+        player = player % 2 + 1
+    return {"game": number, "player1": engine1["name"],
+            "player2": engine2["name"], "cols": cols, "lines": lines,
+            "seed": seed, "result": board.check_gameover(),
+            "moves": [move for player, move in board.move_history],
+            "timings1": timings[1], "timings2": timings[2]}
+
+
+def schedule(engines, geometries, games, seed = 2013):
+    """returns the jobs for all games of the tournament
+
+    every pair of engines (or a single engine against itself) plays games
+    on every geometry, taking turns in making the first move
+    """
+
+    if len(engines) == 1: pairs = [(engines[0], engines[0])]
+    else:
+        pairs = [(engines[i], engines[j]) for i in range(len(engines))
+                 for j in range(i + 1, len(engines))]
+    jobs = []
+    for engine1, engine2 in pairs:
+        for cols, lines in geometries:
+            for game in range(games):
+                if game % 2: first, second = engine2, engine1
+                else: first, second = engine1, engine2
+                jobs.append((len(jobs), first, second, cols, lines,
+                             seed + len(jobs)))
+    return jobs
+
+
+def tables(records):
+    """sums the games up to win/draw/loss tables
+
+    every pairing gets a table per geometry, counted for the engine
+    that is named first, an engine that plays itself is counted by seat
+    (player 1 wins/draws/player 2 wins) instead
+    """
+
+    results = {}
+    for record in records:
+        names = sorted([record["player1"], record["player2"]])
+        pairing = results.setdefault(" vs ".join(names), {})
+        geometry = "%dx%d" % (record["cols"], record["lines"])
+        if names[0] == names[1]:
+            table = pairing.setdefault(geometry, {"player1_wins": 0,
+                                                  "draws": 0,
+                                                  "player2_wins": 0})
+            if record["result"] == 3: table["draws"] += 1
+            else: table["player%d_wins" % record["result"]] += 1
+            continue
+        table = pairing.setdefault(geometry, {"wins": 0, "draws": 0,
+                                              "losses": 0})
+        if record["result"] == 3:
+            table["draws"] += 1
+        elif record["player%d" % record["result"]] == names[0]:
+            table["wins"] += 1
+        else:
+            table["losses"] += 1
+    return results
+
+
+def timing_summary(records):
+    """returns the move time statistics of every engine"""
+
+    timings = {}
+    for record in records:
+        timings.setdefault(record["player1"], []).extend(record["timings1"])
+        timings.setdefault(record["player2"], []).extend(record["timings2"])
+    summary = {}
+    for name, seconds in timings.items():
+        if not seconds: continue
+        summary[name] = {"moves": len(seconds),
+                         "mean": sum(seconds) / len(seconds),
+                         "p50": percentile(seconds, 50),
+                         "p90": percentile(seconds, 90),
+                         "p99": percentile(seconds, 99),
+                         "max": max(seconds)}
+    return summary
+
+
+def run(engines, geometries, games, processes = None, seed = 2013):
+    """plays the whole tournament and returns its results"""
+
+    engines = [parse_engine(engine) for engine in engines]
+    jobs = schedule(engines, geometries, games, seed)
+    workers = Pool(processes)
+    try:
+        records = list(workers.imap_unordered(play_game, jobs))
+    finally:
+        workers.close()
+        workers.join()
+    records.sort(key = lambda record: record["game"])
+    return {"engines": engines,
+            "geometries": ["%dx%d" % tuple(geometry)
+                           for geometry in geometries],
+            "seed": seed,
+            "tables": tables(records),
+            "timings": timing_summary(records),
+            "games": records}
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description = "plays engines against each other")
+    parser.add_argument("--engine", action = "append", dest = "engines",
+                        help = "engine, e.g. ai2:depth=3 (repeatable)")
+    parser.add_argument("--geometry", nargs = 2, type = int, action = "append",
+                        metavar = ("COLS", "LINES"), dest = "geometries",
+                        help = "board size (repeatable, default 7 6)")
+    parser.add_argument("--games", type = int, default = 10,
+                        help = "games per pairing and geometry")
+    parser.add_argument("--processes", type = int, default = None,
+                        help = "number of processes (default: all cores)")
+    parser.add_argument("--seed", type = int, default = 2013)
+    parser.add_argument("--output", default = "tournament.json",
+                        help = "file for the JSON results")
+    args = parser.parse_args()
+    results = run(args.engines or ["ai2"], args.geometries or [(7, 6)],
+                  args.games, args.processes, args.seed)
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent = 2, sort_keys = True)
@@ -0,0 +1,220 @@
+# Copyright (c) 2013, Robert Rueger <rueger@itp.uni-frankfurt.de>
+#
+# This file is part of RC4.
+#
+# RC4 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# RC4 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RC4.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Transposition table for the Connect Four search"""
+
+from struct import Struct
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+    from multiprocessing import resource_tracker
+except ImportError:  # Python < 3.8, there is no SharedTranspositionTable then
+    SharedMemory = None
+
+
+# bound types of the stored scores
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# layout of a SharedTranspositionTable: a header with the number of slots and
+# the stop flag, followed by the slots, each holding key ^ data and data
+SHARED_HEADER = Struct("<QQ")
+SHARED_SLOT = Struct("<QQ")
+STOP_FLAG = 8
+
+# data of a shared slot, from the lowest bit up: score + SCORE_OFFSET
+# (32 bits), depth (12 bits), move (8 bits, NO_MOVE for None), bound (2 bits)
+# and generation (10 bits)
+SCORE_OFFSET = 1 << 31
+NO_MOVE = 255
+
+
+class TranspositionTable:
+
+
+    def __init__(self, size = 1 << 18):
+        """sets up an empty table with room for size entries"""
+
+        # every position hashes into exactly one slot
+        # a slot holds (key, depth, score, bound, move, generation)
+        self.size = size
+        self.slots = [None] * size
+        self.generation = 0
+
+
+    def __len__(self):
+        """returns the number of occupied slots"""
+
+        return self.size - self.slots.count(None)
+
+
+    def new_search(self):
+        """marks all entries as left over from earlier searches"""
+
+        self.generation += 1
+
+
+    def clear(self):
+        """forgets everything"""
+
+        self.slots = [None] * self.size
+
+
+    def lookup(self, key):
+        """returns the entry (key, depth, score, bound, move) for key or None"""
+
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key: return entry
+        return None
+
+
+    def store(self, key, depth, score, bound, move):
+        """stores a search result, if it is worth more than the slot's entry
+
+        entries of the same position and entries from earlier searches are
+        always replaced, entries of the current search only by deeper ones
+        """
+
+        index = key % self.size
+        entry = self.slots[index]
+        if entry is None or entry[0] == key or \
+           entry[5] != self.generation or depth >= entry[1]:
+            self.slots[index] = (key, depth, score, bound, move,
+                                 self.generation)
+
+
+class SharedTranspositionTable:
+
+
+    def __init__(self, size = 1 << 18, name = None):
+        """sets up an empty table with room for size entries in shared memory
+
+        or, if a name is given, attaches to the table of that name, which
+        another process has set up
+        """
+
+        if SharedMemory is None:
+            raise RuntimeError("shared memory needs Python 3.8 or newer!")
+        if name is None:
+            self.memory = SharedMemory(create = True, size =
+                SHARED_HEADER.size + size * SHARED_SLOT.size)
+            self.owner = True
+            self.buffer = self.memory.buf
+            self.clear()
+            SHARED_HEADER.pack_into(self.buffer, 0, size, 0)
+        else:
+            # only the owner may free the memory, when it's done with it
+            try:
+                self.memory = SharedMemory(name, track = False)
+            except TypeError:  # before Python 3.13 every process tracks it
+                register = resource_tracker.register
+                resource_tracker.register = lambda name, rtype: None
+                try:
+                    self.memory = SharedMemory(name)
+                finally:
+                    resource_tracker.register = register
+            self.owner = False
+            self.buffer = self.memory.buf
+            size = SHARED_HEADER.unpack_from(self.buffer, 0)[0]
+        self.name = self.memory.name
+        self.size = size
+        self.generation = 0
+
+
+    def __len__(self):
+        """returns the number of occupied slots"""
+
+        return sum(1 for check, data in SHARED_SLOT.iter_unpack(
+            self.buffer[SHARED_HEADER.size:]) if data)
+
+
+    def new_search(self):
+        """marks all entries as left over from earlier searches
+
+        the processes that attach to the table have to be told the new
+        generation, it is not shared
+        """
+
+        self.generation += 1
+
+
+    def clear(self):
+        """forgets everything"""
+
+        slots = self.buffer[SHARED_HEADER.size:]
+        slots[:] = bytes(len(slots))
+
+
+    def lookup(self, key):
+        """returns the entry (key, depth, score, bound, move) for key or None
+
+        slots are written without any locks, a slot that has been read while
+        another process was writing it fails the check and is ignored
+        """
+
+        check, data = SHARED_SLOT.unpack_from(self.buffer,
+            SHARED_HEADER.size + key % self.size * SHARED_SLOT.size)
+        if data and check ^ data == key: return self.entry(key, data)
+        return None
+
+
+    def store(self, key, depth, score, bound, move):
+        """stores a search result, if it is worth more than the slot's entry
+
+        the same as TranspositionTable.store
+        """
+
+        offset = SHARED_HEADER.size + key % self.size * SHARED_SLOT.size
+        check, data = SHARED_SLOT.unpack_from(self.buffer, offset)
+        generation = self.generation & 1023
+        if data and check ^ data != key and data >> 54 == generation and \
+           depth < data >> 32 & 4095:
+            return
+        if move is None: move = NO_MOVE
+        data = (score + SCORE_OFFSET) | depth << 32 | move << 44 | \
+               bound << 52 | generation << 54
+        SHARED_SLOT.pack_into(self.buffer, offset, key ^ data, data)
+
+
+    def entry(self, key, data):
+        """returns the entry tuple for the data of a slot"""
+
+        move = data >> 44 & 255
+        if move == NO_MOVE: move = None
+        return (key, data >> 32 & 4095, (data & 0xffffffff) - SCORE_OFFSET,
+                data >> 52 & 3, move, data >> 54)
+
+
+    def stop(self, stopped = True):
+        """sets (or clears) the stop flag, that all processes can see"""
+
+        self.buffer[STOP_FLAG] = 1 if stopped else 0
+
+
+    def stopped(self):
+        """returns True if the stop flag is set"""
+
+        return self.buffer[STOP_FLAG] != 0
+
+
+    def close(self):
+        """detaches from the table, its owner frees the shared memory"""
+
+        self.buffer = None
+        self.memory.close()
+        if self.owner: self.memory.unlink()